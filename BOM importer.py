@@ -1,8 +1,11 @@
-import pandas as pd
 import sqlite3
 import os
 import json
 import re
+import sys
+from facet_cache import rebuild_facets
+from spreadsheet_cache import load_workbook
+from import_bom_data import apply_bom_updates
 
 # --- 1. Configuration ---
 # This script is designed to read the new, transposed (columns-as-IFUs) spreadsheet.
@@ -10,88 +13,98 @@ import re
 BOM_FILENAME = "BOM extraction mock-up.xlsx"  # The name of your new transposed BOM file.
 DATABASE_FILENAME = "ifu_database.db"
 
+# Row labels (matched as substrings) that make up each ifu_documents field. A field can span
+# several rows, e.g. "Kit Code 1", "Kit Code 2"; market takes the first filled one.
+FIELD_ROW_LABELS = {
+    "kit_code": "Kit Code",
+    "dispatch_code": "Dispatch Code",
+    "sample_type": "Sample Collection Type",
+    "consumables": "Consumable Name",
+    "market": "Market",
+}
+
+
+def extract_field_values(df, label):
+    """
+    Returns, for every column of the transposed sheet, the non-blank values of the rows whose
+    label contains `label`, top to bottom, as plain Python values.
+    """
+    rows = [isinstance(row_label, str) and label in row_label for row_label in df.index]
+    block = df.loc[rows]
+    values = block.to_numpy(dtype=object)
+    present = block.notna().to_numpy()
+    return [values[present[:, position], position].tolist() for position in range(values.shape[1])]
+
+
+def build_transposed_bom_updates(workbook):
+    """
+    Reads a transposed BOM (one column per IFU) and returns the ifu_documents updates it
+    implies, in column order, as (sample_type, market, dispatch_code, kit_code, consumables,
+    part_number) rows, with one-to-many fields aggregated into JSON lists.
+    """
+    # Use the first column ("Field") as the index for easy lookups
+    df = workbook.frame(index_col=0)
+
+    # Classify the row labels once, then pull every IFU column out of each field's rows in one slice.
+    field_values = {field: extract_field_values(df, label) for field, label in FIELD_ROW_LABELS.items()}
+
+    updates = []
+    for position, part_num_with_rev in enumerate(df.columns):
+        # --- NEW LOGIC: Strip the revision number to match the database format ---
+        # This regex finds the base part number (e.g., "QR-IFU-115") from "QR-IFU-115-R0"
+        match = re.match(r'(QR-IFU-\d+)', str(part_num_with_rev))
+        if not match:
+            print(f"  -> INFO: Skipping column '{part_num_with_rev}' as it does not look like a valid Part Number.")
+            continue
+        part_num = match.group(1)
+
+        markets = field_values["market"][position]
+        updates.append((
+            json.dumps(field_values["sample_type"][position]),   # Store list as JSON string
+            str(markets[0]) if markets else "US",
+            json.dumps(field_values["dispatch_code"][position]), # Store list as JSON string
+            json.dumps(field_values["kit_code"][position]),      # Store list as JSON string
+            json.dumps(field_values["consumables"][position]),   # Store list as JSON string
+            part_num # Use the cleaned part number for the lookup
+        ))
+        print(f"  -> Processing Part Number: {part_num} (from column {part_num_with_rev})")
+    return updates
+
+
 def import_transposed_bom_data():
     """
     Reads a transposed BOM spreadsheet, handles one-to-many relationships by
-    aggregating data into JSON lists, and updates the database.
+    aggregating data into JSON lists, and updates the database. Returns False on a fatal error.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     bom_path = os.path.join(script_dir, BOM_FILENAME)
     if not os.path.exists(bom_path):
         print(f"ERROR: Clean BOM file not found at '{bom_path}'")
-        return
+        return False
 
     print("Reading transposed BOM data...")
     try:
-        # Use the first column ("Field") as the index for easy lookups
-        df = pd.read_excel(bom_path, index_col=0) 
+        updates = build_transposed_bom_updates(load_workbook(bom_path))
     except Exception as e:
         print(f"ERROR: Could not read Excel file. Details: {e}")
-        return
+        return False
 
     # Connect to the database
     conn = sqlite3.connect(DATABASE_FILENAME)
     cursor = conn.cursor()
-    update_count = 0
-
-    # Loop through each COLUMN in the spreadsheet (each column is an IFU)
-    for part_num_with_rev in df.columns:
-        try:
-            # --- NEW LOGIC: Strip the revision number to match the database format ---
-            # This regex finds the base part number (e.g., "QR-IFU-115") from "QR-IFU-115-R0"
-            match = re.match(r'(QR-IFU-\d+)', part_num_with_rev)
-            if not match:
-                print(f"  -> INFO: Skipping column '{part_num_with_rev}' as it does not look like a valid Part Number.")
-                continue
-            part_num = match.group(1)
-            
-            print(f"  -> Processing Part Number: {part_num} (from column {part_num_with_rev})")
-            
-            # Get the series of data for the current IFU column
-            ifu_data = df[part_num_with_rev]
-
-            # Aggregate multiple rows into lists
-            kit_codes = [v for k, v in ifu_data.items() if 'Kit Code' in k and pd.notna(v)]
-            dispatch_codes = [v for k, v in ifu_data.items() if 'Dispatch Code' in k and pd.notna(v)]
-            sample_types = [v for k, v in ifu_data.items() if 'Sample Collection Type' in k and pd.notna(v)]
-            consumables = [v for k, v in ifu_data.items() if 'Consumable Name' in k and pd.notna(v)]
-            
-            market = next((v for k, v in ifu_data.items() if 'Market' in k and pd.notna(v)), "US")
-
-            # Execute the UPDATE query for the matching part number
-            cursor.execute('''
-                UPDATE ifu_documents
-                SET 
-                    sample_type = ?, 
-                    market = ?, 
-                    dispatch_code = ?, 
-                    kit_code = ?, 
-                    consumables = ?
-                WHERE part_number = ?
-            ''', (
-                json.dumps(sample_types),   # Store list as JSON string
-                str(market),
-                json.dumps(dispatch_codes), # Store list as JSON string
-                json.dumps(kit_codes),      # Store list as JSON string
-                json.dumps(consumables),    # Store list as JSON string
-                part_num # Use the cleaned part number for the lookup
-            ))
-            
-            if cursor.rowcount > 0:
-                update_count += cursor.rowcount
-                print(f"    -> SUCCESS: Updated {cursor.rowcount} record(s) in the database.")
-            else:
-                print(f"    -> INFO: No existing record found in the database for Part Number {part_num}.")
-
-        except Exception as e:
-            print(f"An unexpected error occurred while processing {part_num_with_rev}: {e}")
-            continue
+    update_count, _, missing = apply_bom_updates(cursor, updates)
+    for part_num in missing:
+        print(f"    -> INFO: No existing record found in the database for Part Number {part_num}.")
 
+    # Refresh the dropdown facets in the same transaction as the import.
+    rebuild_facets(cursor)
     conn.commit()
     conn.close()
     
     print(f"\n--- Transposed BOM Import Complete ---")
     print(f"A total of {update_count} database entries were updated.")
+    return True
 
 if __name__ == '__main__':
-    import_transposed_bom_data()
+    if not import_transposed_bom_data():
+        sys.exit(1)
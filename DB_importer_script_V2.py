@@ -3,17 +3,20 @@ import os
 import json
 import re
 import hashlib
+import sys
 from datetime import datetime
+from sentence_index import initialize_sentence_index, clear_document_sentences, index_panel_sentences
+from draft_store import initialize_draft_panels
 
 # --- 1. Configuration ---
 DATABASE_FILE = "ifu_database.db"
 BATCH_OUTPUT_FILE = "batch_extraction_output.json" 
-LAYOUT_CONFIG_FOLDER = "layout_configs" 
+LAYOUT_CONFIG_FOLDER = "LAYOUT_CONFIGS" 
 # This dictionary should be kept in sync with the mapping in your PDF extraction script.
 LAYOUT_MAPPING = {
     "IFU-111": "26panel_layout.json",
     "IFU-098": "22panel_layout.json",
-    "IFU-241": "18panel_layout.json",
+    "IFU-241": "22panel_layout.json",
     "IFU-122": "14bpanel_layout.json",
     "IFU-064": "12panel_layout.json",
     "IFU-063": "10panel_layout.json",
@@ -68,6 +71,9 @@ def initialize_database():
         )
     ''')
 
+    # Inverted index of normalized sentences, for "where is this sentence used" lookups.
+    initialize_sentence_index(cursor)
+
     # Table 3: IFU Requests (for NPI workflow)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ifu_requests (
@@ -76,6 +82,28 @@ def initialize_database():
             consumables TEXT, market TEXT, created_by TEXT, created_at TIMESTAMP
         )
     ''')
+    # Columns written by the request form and the Jira webhook
+    request_columns = ['jira_key', 'request_summary', 'summary', 'issuetype', 'project', 'description',
+                       'customfield_10016', 'customfield_10017', 'customfield_10018', 'customfield_10019',
+                       'customfield_10020', 'customfield_10021', 'customfield_10022']
+    for column in request_columns:
+        try:
+            cursor.execute(f'ALTER TABLE ifu_requests ADD COLUMN {column} TEXT')
+            print(f"  -> Added column '{column}' to 'ifu_requests'.")
+        except sqlite3.OperationalError:
+            pass # Column already exists
+
+    # Table 4: Content Drafts (written by the content team, approved by Regulatory)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_drafts (
+            draft_id INTEGER PRIMARY KEY AUTOINCREMENT, request_id INTEGER, status TEXT NOT NULL,
+            created_by TEXT, created_at TIMESTAMP, content_panels TEXT, jira_key TEXT, request_summary TEXT,
+            market TEXT, sample_type TEXT, consumables TEXT,
+            FOREIGN KEY (request_id) REFERENCES ifu_requests (request_id)
+        )
+    ''')
+    # Draft panels live in their own table, one row per panel.
+    initialize_draft_panels(cursor)
 
     # Tables for Users and Roles
     cursor.execute('CREATE TABLE IF NOT EXISTS roles (id INTEGER PRIMARY KEY, role_name TEXT UNIQUE)')
@@ -119,33 +147,24 @@ def generate_hash(text):
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 # --- 4. Main Processing Logic ---
-def process_and_load_data():
-    """Reads the JSON output from the extractor and populates the database."""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    batch_file_path = os.path.join(script_dir, BATCH_OUTPUT_FILE)
-    layout_folder_path = os.path.join(script_dir, LAYOUT_CONFIG_FOLDER)
-
-    if not os.path.exists(batch_file_path):
-        print(f"FATAL ERROR: Batch output file not found at '{batch_file_path}'.")
-        return
-
-    with open(batch_file_path, 'r', encoding='utf-8') as f:
-        all_documents_data = json.load(f)
-
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-
-    for filename, panel_data in all_documents_data.items():
-        print(f"\n--- Processing: {filename} ---")
-        if "error" in panel_data:
-            print("  -> SKIPPING: File has an extraction error.")
-            continue
+def load_document(cursor, filename, panel_data, layout_folder_path, layout_config=None):
+    """
+    Loads one extracted document (its panels, keyed by panel number) into the database,
+    replacing any panels already stored for the same part number, version and language.
+    The layout is looked up in LAYOUT_MAPPING unless the one used for extraction is passed in
+    (e.g. an inferred layout). Returns a summary dict; it has a "skipped" reason instead if the
+    document can't be loaded.
+    """
+    if "error" in panel_data:
+        print("  -> SKIPPING: File has an extraction error.")
+        return {"skipped": f"Extraction error: {panel_data['error']}"}
 
+    if layout_config is None:
         layout_key = next((key for key in LAYOUT_MAPPING if key in filename.replace("_", "-")), None)
         if not layout_key:
             print(f"  -> SKIPPING: Could not find a key in LAYOUT_MAPPING for this filename.")
-            continue
-        
+            return {"skipped": "No key in LAYOUT_MAPPING matches this filename."}
+
         layout_filename = LAYOUT_MAPPING[layout_key]
         layout_filepath = os.path.join(layout_folder_path, layout_filename)
 
@@ -154,61 +173,92 @@ def process_and_load_data():
                 layout_config = json.load(f)
         except FileNotFoundError:
             print(f"  -> SKIPPING: Layout file '{layout_filename}' not found.")
+            return {"skipped": f"Layout file '{layout_filename}' not found."}
+
+    panel_types = layout_config.get("panel_types", {})
+    metadata_panel_nums = panel_types.get("metadata", [])
+    metadata_text = "".join(panel.get("english", "") + panel.get("spanish", "") for num_str, panel in panel_data.items() if int(num_str) in metadata_panel_nums)
+    
+    part_number, doc_version = get_metadata_from_text(metadata_text)
+
+    if not part_number:
+        print(f"  -> SKIPPING: Could not extract Part Number and Version from metadata text.")
+        return {"skipped": "Could not extract Part Number and Version from the metadata panels."}
+
+    print(f"  -> Identified Part Number: {part_number}, Version: {doc_version}")
+    summary = {"part_number": part_number, "document_version": doc_version, "documents": []}
+
+    # Process each language
+    for lang in ["english", "spanish"]:
+        lang_content_exists = any(p.get(lang) for p in panel_data.values())
+        if not lang_content_exists:
             continue
 
-        panel_types = layout_config.get("panel_types", {})
-        metadata_panel_nums = panel_types.get("metadata", [])
-        metadata_text = "".join(panel.get("english", "") + panel.get("spanish", "") for num_str, panel in panel_data.items() if int(num_str) in metadata_panel_nums)
+        cursor.execute('''
+            INSERT OR IGNORE INTO ifu_documents (part_number, document_version, language, source_filename, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (part_number, doc_version, lang, filename, datetime.now()))
         
-        part_number, doc_version = get_metadata_from_text(metadata_text)
-
-        if not part_number:
-            print(f"  -> SKIPPING: Could not extract Part Number and Version from metadata text.")
+        cursor.execute('SELECT id FROM ifu_documents WHERE part_number=? AND document_version=? AND language=?', (part_number, doc_version, lang))
+        doc_id_tuple = cursor.fetchone()
+        if not doc_id_tuple:
+            print(f"  -> CRITICAL ERROR: Could not retrieve doc_id for {part_number} {doc_version} ({lang}).")
             continue
+        doc_id = doc_id_tuple[0]
+
+        cursor.execute('DELETE FROM content_panels WHERE document_id = ?', (doc_id,))
+        clear_document_sentences(cursor, doc_id)
+        print(f"  -> Cleared old panels for {part_number} {doc_version} ({lang})...")
 
-        print(f"  -> Identified Part Number: {part_number}, Version: {doc_version}")
+        panel_count = 0
+        for panel_num_str, content_dict in panel_data.items():
+            text = content_dict.get(lang)
+            if not text: continue
 
-        # Process each language
-        for lang in ["english", "spanish"]:
-            lang_content_exists = any(p.get(lang) for p in panel_data.values())
-            if not lang_content_exists:
-                continue
+            panel_num = int(panel_num_str)
+            panel_type = get_panel_type(panel_num, panel_types)
+            text_hash = generate_hash(text)
 
+            print(f"    -> Inserting Panel {panel_num} ({panel_type}), Hash: {text_hash[:8]}...")
             cursor.execute('''
-                INSERT OR IGNORE INTO ifu_documents (part_number, document_version, language, source_filename, created_at)
+                INSERT INTO content_panels (document_id, panel_number, panel_type, content_text, content_hash)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (part_number, doc_version, lang, filename, datetime.now()))
-            
-            cursor.execute('SELECT id FROM ifu_documents WHERE part_number=? AND document_version=? AND language=?', (part_number, doc_version, lang))
-            doc_id_tuple = cursor.fetchone()
-            if not doc_id_tuple:
-                print(f"  -> CRITICAL ERROR: Could not retrieve doc_id for {part_number} {doc_version} ({lang}).")
-                continue
-            doc_id = doc_id_tuple[0]
-
-            cursor.execute('DELETE FROM content_panels WHERE document_id = ?', (doc_id,))
-            print(f"  -> Cleared old panels for {part_number} {doc_version} ({lang})...")
-
-            for panel_num_str, content_dict in panel_data.items():
-                text = content_dict.get(lang)
-                if not text: continue
-
-                panel_num = int(panel_num_str)
-                panel_type = get_panel_type(panel_num, panel_types)
-                text_hash = generate_hash(text)
-
-                print(f"    -> Inserting Panel {panel_num} ({panel_type}), Hash: {text_hash[:8]}...")
-                cursor.execute('''
-                    INSERT INTO content_panels (document_id, panel_number, panel_type, content_text, content_hash)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (doc_id, panel_num, panel_type, text, text_hash))
+            ''', (doc_id, panel_num, panel_type, text, text_hash))
+            index_panel_sentences(cursor, doc_id, cursor.lastrowid, panel_num, lang, text)
+            panel_count += 1
+        summary["documents"].append({"document_id": doc_id, "language": lang, "panels": panel_count})
+
+    return summary
+
+
+def process_and_load_data():
+    """Reads the JSON output from the extractor and populates the database. Returns False on a fatal error."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    batch_file_path = os.path.join(script_dir, BATCH_OUTPUT_FILE)
+    layout_folder_path = os.path.join(script_dir, LAYOUT_CONFIG_FOLDER)
+
+    if not os.path.exists(batch_file_path):
+        print(f"FATAL ERROR: Batch output file not found at '{batch_file_path}'.")
+        return False
+
+    with open(batch_file_path, 'r', encoding='utf-8') as f:
+        all_documents_data = json.load(f)
+
+    conn = sqlite3.connect(DATABASE_FILE)
+    cursor = conn.cursor()
+
+    for filename, panel_data in all_documents_data.items():
+        print(f"\n--- Processing: {filename} ---")
+        load_document(cursor, filename, panel_data, layout_folder_path)
 
     conn.commit()
     conn.close()
     print("\n--- Database processing complete. ---")
+    return True
 
 
 # --- 5. Execution Block ---
 if __name__ == '__main__':
     initialize_database()
-    process_and_load_data()
+    if not process_and_load_data():
+        sys.exit(1)
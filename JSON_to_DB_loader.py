@@ -3,10 +3,12 @@ import os
 import json
 import re
 import hashlib
+import sys
 from datetime import datetime
+from sentence_index import initialize_sentence_index, clear_document_sentences, index_panel_sentences
 
 # --- 1. Configuration ---
-LAYOUT_CONFIG_FOLDER = "layout_configs" 
+LAYOUT_CONFIG_FOLDER = "LAYOUT_CONFIGS" 
 BATCH_OUTPUT_FILE = "batch_extraction_output.json" 
 DATABASE_FILE = "ifu_database.db"
 
@@ -70,6 +72,9 @@ def initialize_database():
         )
     ''')
 
+    # Inverted index of normalized sentences, for "where is this sentence used" lookups.
+    initialize_sentence_index(cursor)
+
     conn.commit()
     conn.close()
     print("Database initialized successfully with two-table schema.")
@@ -102,6 +107,7 @@ def process_and_load_data():
     """
     Main function to read the batch JSON, process each document, and load the 
     data into the new two-table database structure, with hashing for each panel.
+    Returns False on a fatal error.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     batch_file_path = os.path.join(script_dir, BATCH_OUTPUT_FILE)
@@ -109,7 +115,7 @@ def process_and_load_data():
 
     if not os.path.exists(batch_file_path):
         print(f"FATAL ERROR: Batch output file not found at '{batch_file_path}'.")
-        return
+        return False
 
     with open(batch_file_path, 'r', encoding='utf-8') as f:
         all_documents_data = json.load(f)
@@ -171,6 +177,7 @@ def process_and_load_data():
             doc_id = doc_id_tuple[0]
 
             cursor.execute('DELETE FROM content_panels WHERE document_id = ?', (doc_id,))
+            clear_document_sentences(cursor, doc_id)
             print(f"  -> Cleared old panels for {part_number} {doc_version} ({lang})...")
 
             for panel_num_str, content_dict in panel_data.items():
@@ -186,12 +193,15 @@ def process_and_load_data():
                     INSERT INTO content_panels (document_id, panel_number, panel_type, content_text, content_hash)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (doc_id, panel_num, panel_type, text, text_hash))
+                index_panel_sentences(cursor, doc_id, cursor.lastrowid, panel_num, lang, text)
 
     conn.commit()
     conn.close()
     print("\n--- Database processing complete. ---")
+    return True
 
 # --- 5. Execution Block ---
 if __name__ == '__main__':
     initialize_database()
-    process_and_load_data()
+    if not process_and_load_data():
+        sys.exit(1)
@@ -7,7 +7,7 @@ import json
 PDF_TO_MAP = "LGC_STOOL_QR_IFU_058_R0_PREACTIVATED_US_4_PG_WITH_SPANISH_V11_HR.pdf" # Make sure this is the correct filename
 DEBUG_OUTPUT_PDF = "debug_grid.pdf"
 # NEW: A dedicated folder to save our layout blueprint files
-LAYOUT_JSON_OUTPUT_FOLDER = "layout_configs" 
+LAYOUT_JSON_OUTPUT_FOLDER = "LAYOUT_CONFIGS"
 
 # This is the main part you will edit for each new template type.
 # For each page (starting with index 0), define its grid of panels.
@@ -1,10 +1,14 @@
 import fitz  # PyMuPDF
 import os
 import json
+import sys
+import hashlib
+import threading
+from layout_inference import detect_columns, columns_fit
 
 # --- 1. Main Configuration ---
 PDF_FOLDER_NAME = "REPOSITORY FOR PROCESSING" # The folder with the PDFs you want to process
-LAYOUT_CONFIG_FOLDER = "layout_configs" # The folder where you save your JSON blueprints
+LAYOUT_CONFIG_FOLDER = "LAYOUT_CONFIGS" # The folder where you save your JSON blueprints
 
 # This dictionary is the "switchboard". It tells the script which layout blueprint
 # to use for a document. The key should be a unique part of a PDF's filename.
@@ -31,6 +35,11 @@ LAYOUT_MAPPING = {
     "IFU-117": ""
 }
 
+# Column boundaries detected for regulatory panels without explicit `columns`, per layout file,
+# page geometry and panel, kept beside the layouts so later documents reuse them.
+DETECTED_COLUMNS_FILE = "detected_columns.json"
+_detected_columns_lock = threading.Lock()
+
 
 # --- 2. Helper Functions ---
 def clean_parsed_text(text):
@@ -53,10 +62,87 @@ def clean_parsed_text(text):
     return ' '.join(text.split())
 
 
+def select_layout(filename, layout_folder_path):
+    """
+    Picks the layout blueprint for a PDF from its filename, using LAYOUT_MAPPING.
+    Returns {"layout_key", "layout_filename", "config"}, or {"error": ...} if there is none.
+    """
+    normalized_filename = filename.replace("_", "-").upper()
+    layout_key = next((key for key in LAYOUT_MAPPING if key.upper() in normalized_filename), None)
+    if not layout_key:
+        return {"error": "No matching layout configuration found."}
+
+    layout_filename = LAYOUT_MAPPING[layout_key]
+    layout_filepath = os.path.join(layout_folder_path, layout_filename)
+    try:
+        with open(layout_filepath, 'r', encoding='utf-8') as f:
+            return {"layout_key": layout_key, "layout_filename": layout_filename, "config": json.load(f)}
+    except (FileNotFoundError, IsADirectoryError):
+        return {"error": f"Layout file not found: {layout_filename}"}
+
+
+def page_geometry(doc):
+    """Short hash of a document's page sizes. Detected columns are only shared between documents that match."""
+    sizes = [[round(page.rect.width, 1), round(page.rect.height, 1)] for page in doc]
+    return hashlib.sha1(json.dumps(sizes).encode('utf-8')).hexdigest()[:12]
+
+
+def load_detected_columns(layout_folder_path, layout_filename):
+    """The saved {page geometry: {panel: columns}} boundaries for one layout file."""
+    try:
+        with open(os.path.join(layout_folder_path, DETECTED_COLUMNS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f).get(layout_filename, {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_detected_columns(layout_folder_path, layout_filename, detected_columns):
+    """
+    Adds newly detected boundaries for a layout to DETECTED_COLUMNS_FILE. Saved entries are never
+    replaced, so once a panel's columns are recorded for a page geometry, every later document
+    with that geometry is split the same way whatever order the documents arrive in.
+    """
+    path = os.path.join(layout_folder_path, DETECTED_COLUMNS_FILE)
+    with _detected_columns_lock:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            saved = {}
+        changed = False
+        for geometry, panels in detected_columns.items():
+            saved_panels = saved.setdefault(layout_filename, {}).setdefault(geometry, {})
+            for panel_num_str, columns in panels.items():
+                if panel_num_str not in saved_panels:
+                    saved_panels[panel_num_str] = columns
+                    changed = True
+        if changed:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(saved, f, indent=4)
+            os.replace(path + '.tmp', path)
+
+
+def regulatory_columns(saved_columns, panel_num_str, panel_info, panel_words):
+    """
+    Column boundaries for a regulatory panel without explicit `columns`: the saved ones for this
+    layout and page geometry while this document's words still fit them and they split at least
+    as finely as a fresh detection, otherwise the fresh detection (recorded in saved_columns if
+    the panel had none yet). Returns (columns, reused).
+    """
+    columns = detect_columns(panel_words, panel_info['coords'])
+    saved = saved_columns.get(panel_num_str)
+    if saved is not None and len(saved) >= len(columns) and columns_fit(panel_words, saved):
+        return saved, True
+    saved_columns.setdefault(panel_num_str, columns)
+    return columns, False
+
+
 # --- 3. Core Parsing Function ---
-def parse_document_by_words_and_layout(pdf_path, layout_config):
+def parse_document_by_words_and_layout(pdf_path, layout_config, detected_columns=None):
     """
     Extracts words and assigns them to panels based on the provided layout configuration.
+    detected_columns is the layout's saved column cache (see load_detected_columns); boundaries
+    detected for new panels are added to it. Without one, every panel is detected afresh.
     """
     panel_layout = layout_config.get("panel_layout", {})
     panel_types = layout_config.get("panel_types", {})
@@ -69,6 +155,7 @@ def parse_document_by_words_and_layout(pdf_path, layout_config):
         panel_types.get("regulatory_panels_en", [])
     )
     regulatory_panels_en = panel_types.get("regulatory_panels_en", [])
+    regulatory_panels = set(regulatory_panels_en + panel_types.get("regulatory_panels_es", []))
     
     try:
         with fitz.open(pdf_path) as doc:
@@ -77,18 +164,31 @@ def parse_document_by_words_and_layout(pdf_path, layout_config):
                 page_words = page.get_text("words")
                 all_words.extend([w + (page_num,) for w in page_words])
 
+            if detected_columns is None:
+                detected_columns = {}
+            saved_columns = detected_columns.setdefault(page_geometry(doc), {})
+
             final_content = {}
             for panel_num_str, panel_info in panel_layout.items():
                 panel_num = int(panel_num_str)
                 print(f"\n  --- Processing Panel {panel_num} ---")
                 
                 panel_page = panel_info['page']
-                
-                # --- Explicit Column Processing Logic for Regulatory Panels ---
-                if 'columns' in panel_info:
-                    print(f"  -> Applying EXPLICIT column logic for regulatory panel.")
+                columns = panel_info.get('columns')
+
+                # --- Regulatory panels without explicit columns get them from the layout's cache or the word gutters ---
+                if columns is None and panel_num in regulatory_panels:
+                    px0, py0, px1, py1 = panel_info['coords']
+                    panel_words = [w for w in all_words if w[8] == panel_page and px0 <= w[0] < px1 and py0 <= w[1] < py1]
+                    columns, reused = regulatory_columns(saved_columns, panel_num_str, panel_info, panel_words)
+                    print(f"  -> {'Reusing' if reused else 'Detected'} {len(columns)} column(s) for regulatory panel: "
+                          f"splits at {[col['coords'][0] for col in columns[1:]]}")
+
+                # --- Column Processing Logic for Regulatory Panels ---
+                if columns is not None:
+                    print(f"  -> Applying column logic for regulatory panel.")
                     column_texts = []
-                    for i, col_info in enumerate(panel_info['columns']):
+                    for i, col_info in enumerate(columns):
                         cx0, cy0, cx1, cy1 = col_info['coords']
                         col_words = [w for w in all_words if w[8] == panel_page and cx0 <= w[0] < cx1 and cy0 <= w[1] < cy1]
                         col_words.sort(key=lambda w: (w[1], w[0]))
@@ -150,35 +250,29 @@ if __name__ == '__main__':
 
     if not os.path.isdir(pdf_folder_path):
         print(f"Error: PDF folder '{pdf_folder_path}' not found.")
+        sys.exit(1)
     else:
-        pdf_files_to_process = [f for f in os.listdir(pdf_folder_path) if f.lower().endswith('.pdf')]
+        # Sorted, so the first document of each layout (which seeds its column cache) is always the same one.
+        pdf_files_to_process = sorted(f for f in os.listdir(pdf_folder_path) if f.lower().endswith('.pdf'))
         all_documents_data = {}
 
         for filename in pdf_files_to_process:
             print(f"\nProcessing file: {filename}")
             
-            normalized_filename = filename.replace("_", "-").upper()
-            layout_key = next((key for key in LAYOUT_MAPPING if key.upper() in normalized_filename), None)
-            
-            if not layout_key:
-                print(f"  -> WARNING: No layout mapping found for '{filename}'. Skipping file.")
-                all_documents_data[filename] = {"error": "No matching layout configuration found."}
+            layout = select_layout(filename, layout_folder_path)
+            if "error" in layout:
+                print(f"  -> WARNING: {layout['error']} Skipping file.")
+                all_documents_data[filename] = {"error": layout["error"]}
                 continue
 
-            print(f"  -> Found matching layout key: '{layout_key}'")
-            layout_filename = LAYOUT_MAPPING[layout_key]
-            layout_filepath = os.path.join(layout_folder_path, layout_filename)
-            
-            try:
-                with open(layout_filepath, 'r', encoding='utf-8') as f:
-                    active_layout_config = json.load(f)
-            except FileNotFoundError:
-                print(f"  -> ERROR: Layout file '{layout_filename}' not found. Skipping file.")
-                all_documents_data[filename] = {"error": f"Layout file not found: {layout_filename}"}
-                continue
+            print(f"  -> Found matching layout key: '{layout['layout_key']}'")
+            active_layout_config = layout["config"]
 
             file_path = os.path.join(pdf_folder_path, filename)
-            parsed_data = parse_document_by_words_and_layout(file_path, active_layout_config)
+            detected_columns = load_detected_columns(layout_folder_path, layout['layout_filename'])
+            parsed_data = parse_document_by_words_and_layout(file_path, active_layout_config, detected_columns)
+            if 'error' not in parsed_data:
+                save_detected_columns(layout_folder_path, layout['layout_filename'], detected_columns)
             
             all_documents_data[filename] = parsed_data
 
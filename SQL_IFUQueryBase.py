@@ -1,63 +1,193 @@
-import pandas as pd
-import os
-import sqlite3
-
-script_dir = os.path.dirname(os.path.abspath(__file__))
-
-excel_file_name = 'IFU_Workbook_V2_Nov24.xlsx'
-excel_file_path = os.path.join(script_dir, 'IFU_Workbook_V2_Nov24.xlsx')
-
-print(f"Attempting to load Excel file from: {excel_file_path}")
-
-db_file_name = 'GlueApp.db'
-db_file_path = os.path.join(script_dir, db_file_name)
-
-
-conn = None
-
-conn = sqlite3.connect(db_file_path)
-print(f"Successfully connected to SQLite database: {db_file_path}")
-
-try:
-    
-# Load each sheet
-    print("Loading data from Excel sheets")
-    metadata_df = pd.read_excel(excel_file_path, sheet_name='IFU_Metadata')
-    sample_type_df = pd.read_excel(excel_file_path, sheet_name='SampleCollectionType')
-    consumables_df = pd.read_excel(excel_file_path, sheet_name='Consumables')
-    regulatory_content_df = pd.read_excel(excel_file_path, sheet_name='RegulatoryContent')
-    instructional_content_df = pd.read_excel(excel_file_path, sheet_name='InstructionalContent')
-    strings_df = pd.read_excel(excel_file_path, sheet_name='Strings')
-    digitalifu_df = pd.read_excel(excel_file_path, sheet_name='Digital IFUs')
-    videos_df = pd.read_excel(excel_file_path, sheet_name='Videos')
-    temperatures_df = pd.read_excel(excel_file_path, sheet_name='Temperatures')
-    designfiles_df = pd.read_excel(excel_file_path, sheet_name='DesignFiles')
-    notes_df = pd.read_excel (excel_file_path, sheet_name='Notes')
-
-    print(f"Sheets loaded successfully from Excel.")
-
-# Insert data into the database
-    print("Inserting data into SQLite database tables...")
-    metadata_df.to_sql('IFU_Metadata', conn, if_exists='replace', index=False)
-    sample_type_df.to_sql('SampleCollectionType', conn, if_exists='replace', index=False)
-    consumables_df.to_sql('Consumables', conn, if_exists='replace', index=False)
-    regulatory_content_df.to_sql('RegulatoryContent', conn, if_exists='replace', index=False)
-    instructional_content_df.to_sql('InstructionalContent', conn, if_exists='replace', index=False)
-    temperatures_df.to_sql('Temperatures', conn, if_exists='replace', index=False)
-    strings_df.to_sql('Strings', conn, if_exists='replace', index=False)
-    designfiles_df.to_sql("DesignFiles", conn, if_exists='replace', index=False)
-    notes_df.to_sql("Notes", conn, if_exists='replace', index=False)
-    digitalifu_df.to_sql("Digital IFUs", conn, if_exists='replace', index=False)
-    videos_df.to_sql("Videos", conn, if_exists='replace', index=False)
-    print(f"Data inserted into the database successfully.")
-
-except FileNotFoundError:
-    print(f"ERROR: Excel file not found at path: {excel_file_path}")
-except sqlite3.Error as e_sqlite:
-    print(f"SQLite error occurred: {e_sqlite}")
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-finally:
-    if conn:
-        conn.close()
-        print("Database connection closed.")
\ No newline at end of file
+import os
+import sqlite3
+import argparse
+import hashlib
+import sys
+from spreadsheet_cache import load_workbook
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+excel_file_name = 'IFU_Workbook_V2_Nov24.xlsx'
+excel_file_path = os.path.join(script_dir, 'IFU_Workbook_V2_Nov24.xlsx')
+
+db_file_name = 'GlueApp.db'
+db_file_path = os.path.join(script_dir, db_file_name)
+
+# Each workbook sheet is copied to the table of the same name. The natural key identifies a
+# row across runs, so sync mode can tell an edited row from a deleted and re-added one.
+SHEET_KEYS = {
+    'IFU_Metadata': ['DocumentID'],
+    'SampleCollectionType': ['SampleCollectionTypeID'],
+    'Consumables': ['ConsumableID'],
+    'RegulatoryContent': ['DocumentID', 'StepNumber'],
+    'InstructionalContent': ['DocumentID', 'StepNumber'],
+    'Temperatures': ['DocumentID', 'String ID'],
+    'Strings': ['StringID'],
+    'DesignFiles': ['FileID'],
+    'Notes': ['NoteID'],
+    'Digital IFUs': ['DocumentID'],
+    'Videos': ['DocumentID'],
+}
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def load_sheet_frames(path=excel_file_path):
+    """Loads every sheet (the workbook is parsed once, or loaded from the spreadsheet cache if unchanged)."""
+    print(f"Attempting to load Excel file from: {path}")
+    print("Loading data from Excel sheets")
+    workbook = load_workbook(path)
+    frames = {sheet: workbook.frame(sheet) for sheet in SHEET_KEYS}
+    print(f"Sheets loaded successfully from Excel.")
+    return frames
+
+
+# --- Replace mode: drop and rewrite every table ---
+def replace_tables(conn, frames):
+    print("Inserting data into SQLite database tables...")
+    for table, df in frames.items():
+        df.to_sql(table, conn, if_exists='replace', index=False)
+    print(f"Data inserted into the database successfully.")
+
+
+# --- Sync mode: apply only the rows that changed ---
+def _stage_frame(table, df):
+    """
+    Writes a sheet to an in-memory table exactly as to_sql would write it to GlueApp.db, and
+    reads it back. Returns (CREATE TABLE statement, columns, rows), with every value already
+    converted the way SQLite will store it, so rows compare equal to the stored ones.
+    """
+    staging = sqlite3.connect(':memory:')
+    try:
+        df.to_sql(table, staging, index=False)
+        schema = staging.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        columns = [column[1] for column in staging.execute(f'PRAGMA table_info({_quote(table)})')]
+        rows = staging.execute(f'SELECT * FROM {_quote(table)}').fetchall()
+    finally:
+        staging.close()
+    return schema, columns, rows
+
+
+def _row_digest(row):
+    return hashlib.sha1(repr(row).encode('utf-8')).digest()
+
+
+def _rows_by_key(rows, key_positions):
+    """Maps natural key -> row digest and row. Returns None if any key is missing or repeated."""
+    by_key = {}
+    for row in rows:
+        key = tuple(row[i] for i in key_positions)
+        if None in key or key in by_key:
+            return None
+        by_key[key] = (_row_digest(row), row)
+    return by_key
+
+
+def _rewrite_table(cursor, table, schema, rows, placeholders):
+    cursor.execute(f'DROP TABLE IF EXISTS {_quote(table)}')
+    cursor.execute(schema)
+    cursor.executemany(f'INSERT INTO {_quote(table)} VALUES ({placeholders})', rows)
+
+
+def sync_table(cursor, table, df, keys):
+    """
+    Brings one table in line with its sheet, touching only the rows whose contents changed.
+    Returns a summary dict. Tables that don't exist yet, whose columns changed, or whose
+    natural key isn't unique are rewritten in full instead.
+    """
+    schema, columns, new_rows = _stage_frame(table, df)
+    placeholders = ', '.join('?' * len(columns))
+    existing = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+
+    if existing is None or existing[0] != schema:
+        _rewrite_table(cursor, table, schema, new_rows, placeholders)
+        return {"action": "created" if existing is None else "rebuilt (columns changed)", "rows": len(new_rows)}
+
+    key_positions = [columns.index(key) for key in keys if key in columns]
+    old_by_key = _rows_by_key(cursor.execute(f'SELECT * FROM {_quote(table)}').fetchall(), key_positions)
+    new_by_key = _rows_by_key(new_rows, key_positions)
+    if len(key_positions) != len(keys) or old_by_key is None or new_by_key is None:
+        _rewrite_table(cursor, table, schema, new_rows, placeholders)
+        return {"action": f"rebuilt (natural key {'+'.join(keys)} not unique)", "rows": len(new_rows)}
+
+    inserts = [row for key, (_, row) in new_by_key.items() if key not in old_by_key]
+    deletes = [key for key in old_by_key if key not in new_by_key]
+    updates = [row for key, (digest, row) in new_by_key.items() if key in old_by_key and old_by_key[key][0] != digest]
+
+    key_clause = ' AND '.join(f'{_quote(key)} = ?' for key in keys)
+    other_columns = [column for column in columns if column not in keys]
+    if deletes:
+        cursor.executemany(f'DELETE FROM {_quote(table)} WHERE {key_clause}', deletes)
+    if updates and other_columns:
+        set_clause = ', '.join(f'{_quote(column)} = ?' for column in other_columns)
+        other_positions = [columns.index(column) for column in other_columns]
+        cursor.executemany(f'UPDATE {_quote(table)} SET {set_clause} WHERE {key_clause}', [
+            tuple(row[i] for i in other_positions) + tuple(row[i] for i in key_positions) for row in updates
+        ])
+    if inserts:
+        cursor.executemany(f'INSERT INTO {_quote(table)} VALUES ({placeholders})', inserts)
+    return {"action": "synced", "inserted": len(inserts), "updated": len(updates), "deleted": len(deletes),
+            "unchanged": len(new_by_key) - len(inserts) - len(updates)}
+
+
+def sync_tables(conn, frames):
+    """Syncs every sheet into GlueApp.db in one transaction and prints a change summary."""
+    print("Syncing Excel sheets into SQLite database tables...")
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        summary = {table: sync_table(cursor, table, df, SHEET_KEYS[table]) for table, df in frames.items()}
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+
+    print("\n--- Sync Summary ---")
+    for table, result in summary.items():
+        if result["action"] == "synced":
+            changes = f"+{result['inserted']} ~{result['updated']} -{result['deleted']} ({result['unchanged']} unchanged)"
+            print(f"  {table:<22} {changes if result['inserted'] + result['updated'] + result['deleted'] else 'no changes'}")
+        else:
+            print(f"  {table:<22} {result['action']}: {result['rows']} rows written")
+    return summary
+
+
+def import_workbook(mode='sync', excel_path=excel_file_path, db_path=db_file_path):
+    """
+    Copies the IFU workbook into GlueApp.db, either syncing changed rows (default) or replacing
+    every table. Returns the sync summary (True after a replace), or False if the import failed.
+    """
+    conn = None
+    try:
+        frames = load_sheet_frames(excel_path)
+        conn = sqlite3.connect(db_path)
+        print(f"Successfully connected to SQLite database: {db_path}")
+        if mode == 'replace':
+            replace_tables(conn, frames)
+            return True
+        else:
+            return sync_tables(conn, frames)
+    except FileNotFoundError:
+        print(f"ERROR: Excel file not found at path: {excel_path}")
+        return False
+    except sqlite3.Error as e_sqlite:
+        print(f"SQLite error occurred: {e_sqlite}")
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+            print("Database connection closed.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load the IFU workbook into GlueApp.db.")
+    parser.add_argument('--replace', action='store_true', help="Drop and rewrite every table instead of syncing changed rows.")
+    args = parser.parse_args()
+    if import_workbook('replace' if args.replace else 'sync') is False:
+        sys.exit(1)
@@ -1,6 +1,10 @@
 import pandas as pd
 import sqlite3
 import os
+import json
+import sys
+from facet_cache import rebuild_facets
+from spreadsheet_cache import load_workbook
 
 # --- 1. Configuration ---
 # You MUST adjust these settings to match your stability table file.
@@ -32,69 +36,99 @@ def add_stability_column_to_db():
     conn.close()
 
 
+def build_kit_code_index(cursor):
+    """
+    Maps each kit code (case-folded) to the ids of the IFUs listing it, in one pass over
+    ifu_documents. Only entries of the JSON kit_code lists count, matching the quoted
+    LIKE '%"code"%' lookup this replaces.
+    """
+    index = {}
+    for document_id, raw_kit_codes in cursor.execute('SELECT id, kit_code FROM ifu_documents WHERE kit_code IS NOT NULL'):
+        try:
+            kit_codes = json.loads(raw_kit_codes)
+        except (ValueError, TypeError):
+            continue
+        if isinstance(kit_codes, str):
+            kit_codes = [kit_codes]
+        if not isinstance(kit_codes, list):
+            continue
+        for kit_code in {code.casefold() for code in kit_codes if isinstance(code, str)}:
+            index.setdefault(kit_code, []).append(document_id)
+    return index
+
+
 def import_stability_data():
     """
     Reads the stability table spreadsheet and updates the database
     with the stability type ('General' or 'Specific') for each matching kit code.
+    Returns False on a fatal error.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     stability_path = os.path.join(script_dir, STABILITY_FILE)
     
     if not os.path.exists(stability_path):
         print(f"FATAL ERROR: Stability file not found at '{stability_path}'.")
-        return
+        return False
 
     print(f"Reading data from '{STABILITY_FILE}'...")
     try:
-        df = pd.read_excel(stability_path)
+        df = load_workbook(stability_path).frame()
     except Exception as e:
         print(f"Error reading Excel file: {e}")
-        return
+        return False
 
     # Connect to the database
     conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
-    update_count = 0
 
-    # Loop through each row in the spreadsheet
-    for index, row in df.iterrows():
-        try:
+    # Resolve every row against the kit code index. A later row for the same IFU wins, as it
+    # did when each row ran its own UPDATE.
+    kit_code_index = build_kit_code_index(cursor)
+    stability_by_document = {}
+    matched, unmatched = {}, []
+    try:
+        for index, row in df.iterrows():
             kit_code = str(row[KIT_CODE_COL]).strip()
             approval_status = str(row[MESSAGING_TYPE_COL]).strip().lower()
 
             # Determine stability type based on the approval column
             stability_type = "General" if approval_status == "yes" else "Specific"
-            
-            print(f"  -> Processing Kit Code: {kit_code}, Stability Type: {stability_type}")
-
-            # Find all IFUs that use this kit code and update them.
-            # We must search within the JSON string in the 'kit_code' column.
-            cursor.execute('''
-                UPDATE ifu_documents
-                SET stability_type = ?
-                WHERE kit_code LIKE ?
-            ''', (stability_type, f'%"{kit_code}"%'))
-            
-            if cursor.rowcount > 0:
-                update_count += cursor.rowcount
-                print(f"    -> SUCCESS: Updated {cursor.rowcount} record(s) in the database.")
-
-        except KeyError as e:
-            print(f"\nFATAL ERROR: A column name is incorrect.")
-            print(f"The column '{e}' was not found in your spreadsheet.")
-            conn.close()
-            return
-        except Exception as e:
-            print(f"An unexpected error occurred on row {index}: {e}")
-            continue
 
+            document_ids = kit_code_index.get(kit_code.casefold(), [])
+            if not document_ids:
+                if kit_code not in unmatched:
+                    unmatched.append(kit_code)
+                continue
+            matched[kit_code] = (stability_type, len(document_ids))
+            for document_id in document_ids:
+                stability_by_document[document_id] = stability_type
+    except KeyError as e:
+        print(f"\nFATAL ERROR: A column name is incorrect.")
+        print(f"The column '{e}' was not found in your spreadsheet.")
+        conn.close()
+        return False
+
+    cursor.executemany('UPDATE ifu_documents SET stability_type = ? WHERE id = ?',
+                       [(stability_type, document_id) for document_id, stability_type in stability_by_document.items()])
+    update_count = len(stability_by_document)
+
+    for kit_code, (stability_type, document_count) in matched.items():
+        print(f"  -> Kit Code: {kit_code}, Stability Type: {stability_type}: matched {document_count} record(s).")
+    if unmatched:
+        print(f"  -> No IFU lists these kit code(s): {', '.join(unmatched)}")
+
+    # Refresh the dropdown facets in the same transaction as the import.
+    rebuild_facets(cursor)
     conn.commit()
     conn.close()
     
     print(f"\n--- Stability Data Import Complete ---")
+    print(f"{len(matched)} kit code(s) matched, {len(unmatched)} unmatched.")
     print(f"A total of {update_count} database entries were updated.")
+    return True
 
 if __name__ == '__main__':
     add_stability_column_to_db() # First, make sure the column exists
-    import_stability_data()
+    if not import_stability_data():
+        sys.exit(1)
 
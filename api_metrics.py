@@ -0,0 +1,230 @@
+import sqlite3
+import os
+import re
+import time
+import threading
+import logging
+from collections import defaultdict
+
+# --- 1. Configuration ---
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements slower than this are written to the slow-query log.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('GLUE_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_FILE = os.environ.get('GLUE_SLOW_QUERY_LOG', 'slow_queries.log')
+# Statement labels are truncated so one giant IN-list can't blow up the /metrics output.
+MAX_STATEMENT_LABEL_LENGTH = 160
+
+slow_query_log = logging.getLogger('glue.slow_queries')
+if not slow_query_log.handlers:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG_FILE, delay=True)
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_log.addHandler(_handler)
+    slow_query_log.setLevel(logging.INFO)
+    slow_query_log.propagate = False
+
+
+# --- 2. Metric Types ---
+class Histogram:
+    """A Prometheus-style cumulative histogram."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def render(self, name, labels):
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def statement_label(sql):
+    """Collapses whitespace in a SQL statement so equivalent statements share one series."""
+    statement = ' '.join(sql.split())
+    statement = re.sub(r'\?(\s*,\s*\?)+', '?, ...', statement)  # IN-lists of any length look the same.
+    return statement[:MAX_STATEMENT_LABEL_LENGTH]
+
+
+# --- 3. Registry ---
+class MetricsRegistry:
+    """Holds the API's request and SQL metrics and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = defaultdict(Histogram)
+        self.response_statuses = defaultdict(int)
+        self.query_latency = defaultdict(Histogram)
+        self.slow_queries = 0
+        self.in_flight = 0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method, route, status, seconds):
+        with self._lock:
+            self.in_flight -= 1
+            self.request_latency[(method, route)].observe(seconds)
+            self.response_statuses[(method, route, status)] += 1
+
+    def observe_query(self, sql, parameters, seconds):
+        statement = statement_label(sql)
+        with self._lock:
+            self.query_latency[statement].observe(seconds)
+        if seconds * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+            with self._lock:
+                self.slow_queries += 1
+            # Parameter values can carry user text, so only their count is logged.
+            parameter_count = len(parameters) if hasattr(parameters, '__len__') else '?'
+            slow_query_log.info(f"{seconds * 1000:.1f} ms | {' '.join(sql.split())} | params redacted ({parameter_count} values)")
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP glue_http_request_duration_seconds Time spent handling each API route.',
+                '# TYPE glue_http_request_duration_seconds histogram',
+            ]
+            for (method, route), histogram in sorted(self.request_latency.items()):
+                lines += histogram.render('glue_http_request_duration_seconds', f'method="{method}",route="{_label(route)}"')
+            lines += ['# HELP glue_http_responses_total Responses sent, by route and status code.',
+                      '# TYPE glue_http_responses_total counter']
+            for (method, route, status), count in sorted(self.response_statuses.items()):
+                lines.append(f'glue_http_responses_total{{method="{method}",route="{_label(route)}",status="{status}"}} {count}')
+            lines += ['# HELP glue_http_requests_in_flight Requests currently being handled.',
+                      '# TYPE glue_http_requests_in_flight gauge',
+                      f'glue_http_requests_in_flight {self.in_flight}',
+                      '# HELP glue_sqlite_query_duration_seconds Time to execute each SQL statement and read all of its rows.',
+                      '# TYPE glue_sqlite_query_duration_seconds histogram']
+            for statement, histogram in sorted(self.query_latency.items()):
+                lines += histogram.render('glue_sqlite_query_duration_seconds', f'statement="{_label(statement)}"')
+            lines += ['# HELP glue_sqlite_slow_queries_total Statements slower than the slow-query threshold.',
+                      '# TYPE glue_sqlite_slow_queries_total counter',
+                      f'glue_sqlite_slow_queries_total {self.slow_queries}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+# --- 4. Timed SQLite Connections ---
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports the time of every statement to the registry: executing it and reading
+    its rows, since a SELECT's execute() returns at its first row and a scan does most of its
+    work while the rest are fetched. The sample is recorded once the rows run out, or when the
+    cursor is re-executed, closed or discarded with rows still unread.
+    """
+    _pending = None  # [sql, parameters, seconds so far] while a statement's rows are being read
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            registry.observe_query(*pending)
+
+    def _add_read_time(self, start):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+
+    def _read(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        except Exception:
+            self._add_read_time(start)
+            self._finish()
+            raise
+        finally:
+            self._add_read_time(start)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except Exception:
+            registry.observe_query(sql, parameters, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            registry.observe_query(sql, parameters, elapsed)  # No rows to read.
+        else:
+            self._pending = [sql, parameters, elapsed]
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            registry.observe_query(sql, (), time.perf_counter() - start)
+
+    def fetchone(self):
+        row = self._read(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._read(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._read(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self, _next_row=sqlite3.Cursor.__next__, _clock=time.perf_counter):
+        # Runs once per row when a cursor is iterated, so it avoids the helper calls.
+        start = _clock()
+        try:
+            return _next_row(self)
+        except Exception:  # StopIteration once the rows run out, or an error mid-scan.
+            self._add_read_time(start)
+            self._finish()
+            raise
+        finally:
+            pending = self._pending
+            if pending is not None:
+                pending[2] += _clock() - start
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory (sqlite3.connect(..., factory=TimedConnection)) whose cursors are timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
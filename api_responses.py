@@ -0,0 +1,110 @@
+import json
+import gzip
+import zlib
+from flask import Response, request
+
+# orjson is several times faster than the standard library encoder; it is optional.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- 1. Configuration ---
+# Bodies smaller than this are not worth the CPU time to compress.
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# Streamed responses are flushed to the client in chunks of roughly this size.
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+# --- 2. Encoding Helpers ---
+def dumps(obj):
+    """Encodes an object to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def accepts_gzip():
+    """True if the current request's Accept-Encoding allows gzip."""
+    return request.accept_encodings['gzip'] > 0
+
+
+def _encode_rows(rows):
+    """Yields a JSON array of rows (sqlite3.Row or dicts), one chunk at a time."""
+    buffer = bytearray(b'[')
+    separator = b''
+    for row in rows:
+        buffer += separator
+        buffer += dumps(dict(row))
+        separator = b','
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']'
+    yield bytes(buffer)
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# --- 3. Response Builders ---
+def json_response(payload, status=200):
+    """Builds a JSON response with the fast encoder. Compression is left to compress_response."""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def stream_json_rows(rows, on_close=None, status=200):
+    """
+    Streams an iterable of rows (typically a live sqlite3 cursor) as a JSON array,
+    so the full result set is never held in memory. Results that fit in a single
+    chunk are sent as an ordinary response instead. on_close runs once the body
+    has been sent, which is where the cursor's connection should be closed.
+    """
+    chunks = _encode_rows(rows)
+    first = next(chunks)
+    second = next(chunks, None)
+
+    if second is None:
+        response = Response(first, status=status, mimetype='application/json')
+    else:
+        body = _chain(first, second, chunks)
+        if accepts_gzip():
+            response = Response(_gzip_chunks(body), status=status, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(body, status=status, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def _chain(first, second, rest):
+    yield first
+    yield second
+    yield from rest
+
+
+def compress_response(response):
+    """
+    after_request hook: gzips buffered JSON bodies over GZIP_MIN_BYTES when the client
+    accepts it. Streamed responses compress themselves in stream_json_rows.
+    """
+    if (response.is_streamed or response.direct_passthrough or response.status_code != 200
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES or not accepts_gzip():
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
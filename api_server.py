@@ -2,11 +2,32 @@ import sqlite3
 import json
 import os
 import difflib
-from flask import Flask, jsonify, request, send_from_directory
+import functools
+import itertools
+import time
+import hashlib
+import importlib.util
+import tempfile
+from flask import Flask, Response, jsonify, request, send_from_directory, make_response, g
 from flask_cors import CORS
 from datetime import datetime
 from collections import defaultdict
 from datetime import datetime
+import content_clusters
+import sentence_index
+from data_version import DataVersionWatcher
+from api_responses import json_response, stream_json_rows, compress_response, accepts_gzip, GZIP_MIN_BYTES
+from read_model import CorpusReadModel, build_part_number_summary
+from jira_spool import JiraSpool, payload_problem
+from write_queue import WriteQueue, WriteQueueBusy
+from api_metrics import registry as metrics, TimedConnection
+from request_profiler import ProfilingMiddleware
+from facet_cache import rebuild_facets, load_facets, facet_version
+from facet_index import FacetIndexCache, FILTER_FACETS
+from event_stream import EventBroker
+from draft_store import initialize_draft_panels, insert_draft_panels, load_draft_panels, fetch_pending_draft_headers, DRAFT_HEADER_COLUMNS
+from ingest_jobs import JobRegistry, IngestError, UploadTooLarge, spool_upload
+from werkzeug.utils import secure_filename
 
 def parse_jira_description(description_obj):
     """
@@ -24,62 +45,270 @@ def parse_jira_description(description_obj):
     return "\n".join(full_text)
 
 # --- 1. Configuration ---
-DATABASE_FILE = 'ifu_database.db'
+# GLUE_DATABASE_FILE points the server at another database (e.g. a synthetic one from load_test.py).
+DATABASE_FILE = os.environ.get('GLUE_DATABASE_FILE', 'ifu_database.db')
 CHECKLIST_DATA_FILE = os.path.join('generated_checklists', 'generated_checklist_data.json')
+# Set GLUE_READ_MODEL=1 to serve the IFU list and panels from an in-memory copy of the corpus.
+READ_MODEL_ENABLED = os.environ.get('GLUE_READ_MODEL', '0') == '1'
+# Set GLUE_PROFILING=1 to allow single requests to be profiled (X-Glue-Profile: 1 or ?_profile=1).
+PROFILING_ENABLED = os.environ.get('GLUE_PROFILING', '0') == '1'
+# Most documents one /api/ifu/batch call may ask for.
+MAX_BATCH_DOCUMENTS = 100
+# Uploaded IFU PDFs are kept with the ones dropped in by hand, so later batch runs see them too.
+PDF_UPLOAD_FOLDER = "REPOSITORY FOR PROCESSING"
+MAX_PDF_UPLOAD_BYTES = 100 * 1024 * 1024
+# Hand-made layout blueprints, and the inferred ones saved for review, resolved next to this script.
+LAYOUT_CONFIG_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LAYOUT_CONFIGS")
+# BOM uploads are only kept until their import job has run.
+BOM_UPLOAD_FOLDER = tempfile.gettempdir()
+MAX_BOM_UPLOAD_BYTES = 50 * 1024 * 1024
+# BOM rows applied per transaction, so request writes can get in between the batches of a big import.
+BOM_UPDATE_BATCH_SIZE = 500
 
 # --- 2. Flask App Initialization ---
 app = Flask(__name__)
 CORS(app)
+if PROFILING_ENABLED:
+    # Only wrapped when enabled, so normal deployments carry no profiling overhead at all.
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
 
 # --- 3. Helper Function ---
 def get_db_connection():
     """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+    conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+# All API mutations go through this single writer, which commits them in small groups.
+# Background imports use write_queue.execute_bulk() so they never queue ahead of requests.
+write_queue = WriteQueue(DATABASE_FILE, connection_factory=TimedConnection)
+
+@app.errorhandler(WriteQueueBusy)
+def write_queue_busy(e):
+    """A write that never left the queue was cancelled, so the client can safely retry it."""
+    print(f"ERROR: {e}")
+    response = jsonify({"error": "The database is busy, please retry"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+# Pushes committed request, draft and approval changes to /api/events subscribers.
+event_broker = EventBroker()
+
+# Bumps whenever any loader, importer or API write commits to the database.
+db_version = DataVersionWatcher(DATABASE_FILE)
+
+def database_etag_source():
+    """ETag input for endpoints that only depend on the database contents."""
+    return db_version.token()
+
+def checklist_etag_source():
+    """ETag input for the checklist endpoint, which reads a JSON file rather than the DB."""
+    try:
+        stat = os.stat(CHECKLIST_DATA_FILE)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except FileNotFoundError:
+        return "missing"
+
+def conditional_get(etag_source):
+    """
+    Decorator that gives a GET endpoint a strong ETag built from the request path and
+    etag_source(). A matching If-None-Match is answered with 304 without running the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            # The body differs by Content-Encoding, so a strong ETag has to as well.
+            etag_input = f"{request.full_path}|{etag_source()}|{'gzip' if accepts_gzip() else 'identity'}"
+            etag = hashlib.sha1(etag_input.encode('utf-8')).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapped
+    return decorator
+
+read_model = CorpusReadModel(DATABASE_FILE, db_version) if READ_MODEL_ENABLED else None
+
+# Bitmap index behind /api/ifus/filter, rebuilt when the database changes.
+facet_index = FacetIndexCache(DATABASE_FILE, db_version)
+
+def serve_from_read_model(key):
+    """Returns a response for a read model entry, or None if the model is off or has no such entry."""
+    if read_model is None:
+        return None
+    snapshot = read_model.snapshot()
+    body = snapshot.body(key)
+    if body is None:
+        return None
+    if accepts_gzip() and len(body) >= GZIP_MIN_BYTES:
+        response = Response(snapshot.gzipped_body(key), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def apply_compression(response):
+    """Gzips large JSON bodies for clients that accept it."""
+    return compress_response(response)
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    metrics.request_started()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    """Records per-route latency and status; requests that raised count as 500s."""
+    if 'request_started_at' not in g:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_finished(request.method, route, g.get('response_status', 500), time.perf_counter() - g.request_started_at)
+
 # --- 4. API Endpoints ---
 
 @app.route('/api/ifus', methods=['GET'])
+@conditional_get(database_etag_source)
 def get_all_ifus():
     """Endpoint to fetch a list of all unique IFU documents, including ID."""
+    cached = serve_from_read_model(('ifus',))
+    if cached is not None:
+        return cached
     conn = get_db_connection()
     ifus = conn.execute('SELECT DISTINCT id, part_number, document_version, language FROM ifu_documents ORDER BY part_number, document_version').fetchall()
     conn.close()
     return jsonify([dict(row) for row in ifus])
 
+@app.route('/api/ifus/filter', methods=['GET'])
+@conditional_get(database_etag_source)
+def filter_ifus():
+    """
+    Filters IFUs by any combination of sample_type, market, kit_code, dispatch_code,
+    consumables, stability_type and biomarkers (e.g. ?market=US&sample_type=Blood&consumables=Lancet).
+    Repeating a parameter matches any of its values. Returns the matching IFUs and, per facet,
+    the count of IFUs each value would match. The index query time is in the Server-Timing header.
+    """
+    unknown = sorted(set(request.args) - set(FILTER_FACETS))
+    if unknown:
+        return jsonify({"error": f"Unknown filter(s): {', '.join(unknown)}", "filters": sorted(FILTER_FACETS)}), 400
+    filters = {facet: request.args.getlist(facet) for facet in FILTER_FACETS if request.args.getlist(facet)}
+    index = facet_index.index()
+    started = time.perf_counter()
+    results, counts = index.query(filters)
+    query_ms = (time.perf_counter() - started) * 1000
+    response = json_response({"total": len(results), "results": results, "facet_counts": counts})
+    # The timing stays out of the body: it differs on every run, and the body is served under a strong ETag.
+    response.headers['Server-Timing'] = f"query;dur={query_ms:.3f}"
+    return response
+
 @app.route('/api/ifu/<int:document_id>', methods=['GET'])
+@conditional_get(database_etag_source)
 def get_ifu_details(document_id):
     """Endpoint to fetch all content panels for a single IFU document."""
+    cached = serve_from_read_model(('ifu', document_id))
+    if cached is not None:
+        return cached
     conn = get_db_connection()
-    panels = conn.execute('SELECT * FROM content_panels WHERE document_id = ? ORDER BY panel_number', (document_id,)).fetchall()
-    conn.close()
-    if not panels:
+    cursor = conn.execute('SELECT * FROM content_panels WHERE document_id = ? ORDER BY panel_number', (document_id,))
+    first_panel = cursor.fetchone()
+    if first_panel is None:
+        conn.close()
         return jsonify({"error": "Document not found"}), 404
-    return jsonify([dict(row) for row in panels])
+    return stream_json_rows(itertools.chain([first_panel], cursor), on_close=conn.close)
     
+@app.route('/api/ifu/batch', methods=['POST'])
+def get_ifu_batch():
+    """
+    Fetches the panels of several IFUs in one round trip. The body names the documents either
+    by ID ({"document_ids": [1, 2]}) or by part number and version
+    ({"documents": [{"part_number": "QR-IFU-115", "document_version": "R0"}]}, all languages),
+    and may restrict the panels with "panel_types": ["instructional", ...].
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "The body must be a JSON object"}), 400
+    document_ids = data.get('document_ids') or []
+    documents = data.get('documents') or []
+    panel_types = data.get('panel_types') or []
+    # Checked before use: a string would be taken a character at a time, and bool is a subclass of int.
+    if not isinstance(document_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in document_ids):
+        return jsonify({"error": "'document_ids' must be a list of integers"}), 400
+    if not isinstance(documents, list) or not all(
+            isinstance(d, dict) and all(isinstance(d.get(key), str) and d[key] for key in ('part_number', 'document_version'))
+            for d in documents):
+        return jsonify({"error": "'documents' must be a list of objects with string part_number and document_version"}), 400
+    if not isinstance(panel_types, list) or not all(isinstance(t, str) for t in panel_types):
+        return jsonify({"error": "'panel_types' must be a list of strings"}), 400
+    part_versions = [(d['part_number'], d['document_version']) for d in documents]
+    if not document_ids and not part_versions:
+        return jsonify({"error": "Provide 'document_ids' or 'documents' (part_number + document_version)"}), 400
+    if len(document_ids) + len(part_versions) > MAX_BATCH_DOCUMENTS:
+        return jsonify({"error": f"At most {MAX_BATCH_DOCUMENTS} documents per batch"}), 400
+
+    # One query for the whole batch: ID and (part number, version) IN-lists, plus the optional type filter.
+    conditions, params = [], []
+    if document_ids:
+        conditions.append(f"d.id IN ({', '.join('?' * len(document_ids))})")
+        params += document_ids
+    if part_versions:
+        conditions.append(f"(d.part_number, d.document_version) IN (VALUES {', '.join(['(?, ?)'] * len(part_versions))})")
+        params += [value for pair in part_versions for value in pair]
+    query = f"""
+        SELECT d.id AS document_id, d.part_number, d.document_version, d.language,
+               p.id, p.panel_number, p.panel_type, p.content_text, p.content_hash
+        FROM ifu_documents d LEFT JOIN content_panels p ON p.document_id = d.id
+        {"AND p.panel_type IN (" + ", ".join('?' * len(panel_types)) + ")" if panel_types else ""}
+        WHERE {" OR ".join(conditions)}
+        ORDER BY d.part_number, d.document_version, d.language, p.panel_number
+    """
+    params = list(panel_types) + params
+    conn = get_db_connection()
+    try:
+        documents = {}
+        for row in conn.execute(query, params):
+            document = documents.setdefault(row['document_id'], {
+                "id": row['document_id'], "part_number": row['part_number'],
+                "document_version": row['document_version'], "language": row['language'], "panels": []
+            })
+            if row['id'] is not None:
+                document['panels'].append({
+                    "id": row['id'], "document_id": row['document_id'], "panel_number": row['panel_number'],
+                    "panel_type": row['panel_type'], "content_text": row['content_text'], "content_hash": row['content_hash']
+                })
+    finally:
+        conn.close()
+
+    found_pairs = {(d['part_number'], d['document_version']) for d in documents.values()}
+    missing = [{"document_id": i} for i in document_ids if i not in documents]
+    missing += [{"part_number": pn, "document_version": ver} for pn, ver in part_versions if (pn, ver) not in found_pairs]
+    return json_response({"documents": list(documents.values()), "missing": missing})
+
 @app.route('/api/ifu-by-part-number/<string:part_number>/<string:doc_version>', methods=['GET'])
 def get_ifu_by_part_number(part_number, doc_version):
     """Fetches all enriched metadata for a specific IFU part_number and version."""
+    cached = serve_from_read_model(('part', part_number, doc_version))
+    if cached is not None:
+        return cached
     conn = get_db_connection()
-    records = conn.execute("SELECT * FROM ifu_documents WHERE part_number = ? AND document_version = ?", (part_number, doc_version)).fetchall()
+    records = conn.execute("SELECT * FROM ifu_documents WHERE part_number = ? AND document_version = ? ORDER BY id", (part_number, doc_version)).fetchall()
     conn.close()
     if not records:
         return jsonify({"error": "IFU not found"}), 404
-    
-    kit_codes, consumables, sample_types = set(), set(), set()
-    for record in records:
-        if record['kit_code'] and record['kit_code'] != '[]': kit_codes.update(json.loads(record['kit_code']))
-        if record['consumables'] and record['consumables'] != '[]': consumables.update(json.loads(record['consumables']))
-        if record['sample_type'] and record['sample_type'] != '[]': sample_types.update(json.loads(record['sample_type']))
-        
-    response_data = dict(records[0])
-    response_data['kit_codes'] = sorted(list(kit_codes))
-    response_data['consumables'] = sorted(list(consumables))
-    response_data['sample_types'] = sorted(list(sample_types))
-    return jsonify(response_data)
+    return jsonify(build_part_number_summary(records))
 
 @app.route('/api/checklists', methods=['GET'])
+@conditional_get(checklist_etag_source)
 def get_checklists():
     """Reads the generated checklist JSON file."""
     try:
@@ -98,32 +327,33 @@ def handle_requests():
     - GET: Fetches a list of all requests.
     - POST: Creates a new request.
     """
-    conn = get_db_connection()
     if request.method == 'POST':
         data = request.get_json()
         created_by = data.get('created_by', 'System')
         if 'displayName' in data.get('user', {}):
              created_by = data['user']['displayName']
         
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO ifu_requests (
-                request_type, status, part_number_to_update, sample_type, 
-                biomarkers, stability_period, consumables, market, 
-                created_by, created_at, jira_key, request_summary
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('request_type'), 'Pending Content Review', data.get('part_number_to_update'),
-            data.get('sample_type'), data.get('biomarkers'), data.get('stability_period'),
-            data.get('consumables'), data.get('market'), created_by, datetime.now(),
-            data.get('jira_key'), data.get('request_summary')
-        ))
-        conn.commit()
-        conn.close()
+        def insert_request(cursor):
+            cursor.execute('''
+                INSERT INTO ifu_requests (
+                    request_type, status, part_number_to_update, sample_type, 
+                    biomarkers, stability_period, consumables, market, 
+                    created_by, created_at, jira_key, request_summary
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data.get('request_type'), 'Pending Content Review', data.get('part_number_to_update'),
+                data.get('sample_type'), data.get('biomarkers'), data.get('stability_period'),
+                data.get('consumables'), data.get('market'), created_by, datetime.now(),
+                data.get('jira_key'), data.get('request_summary')
+            ))
+            return dict(cursor.execute('SELECT * FROM ifu_requests WHERE request_id = ?', (cursor.lastrowid,)).fetchone())
+
+        event_broker.publish('request.created', write_queue.execute(insert_request))
         print(f"A new IFU request was created by {created_by}.")
         return jsonify({"message": "Request created successfully"}), 201
     
     if request.method == 'GET':
+        conn = get_db_connection()
         requests_from_db = conn.execute('SELECT * FROM ifu_requests ORDER BY created_at DESC').fetchall()
         conn.close()
         return jsonify([dict(row) for row in requests_from_db])
@@ -139,26 +369,26 @@ def api_search():
         return jsonify({"error": "Missing search term"}), 400
     conn = get_db_connection()
     query_param = f'%{search_term}%'
-    search_results = conn.execute('''
+    cursor = conn.execute('''
         SELECT p.content_text, p.panel_type, d.part_number, d.document_version
         FROM content_panels p
         JOIN ifu_documents d ON p.document_id = d.id
         WHERE p.content_text LIKE ?
-    ''', (query_param,)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in search_results])
+    ''', (query_param,))
+    return stream_json_rows(cursor, on_close=conn.close)
     
 @app.route('/api/approve', methods=['POST'])
 def approve_checklist():
     """Logs a checklist approval."""
     data = request.get_json()
     user_name = data.get('user_name', 'Unknown User')
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO approval_log (part_number, document_version, approved_by, approved_at) VALUES (?, ?, ?, ?)',
-                   (data.get('part_number'), data.get('revision_number'), user_name, datetime.now()))
-    conn.commit()
-    conn.close()
+
+    def log_approval(cursor):
+        cursor.execute('INSERT INTO approval_log (part_number, document_version, approved_by, approved_at) VALUES (?, ?, ?, ?)',
+                       (data.get('part_number'), data.get('revision_number'), user_name, datetime.now()))
+        return dict(cursor.execute('SELECT * FROM approval_log WHERE id = ?', (cursor.lastrowid,)).fetchone())
+
+    event_broker.publish('approval.logged', write_queue.execute(log_approval))
     print(f"Approval logged for {data.get('part_number')} by {user_name}")
     return jsonify({"message": "Approval logged"}), 201
 
@@ -173,71 +403,133 @@ def compare_content():
     conn = get_db_connection()
     base_query = "SELECT d.part_number, d.document_version, d.language, p.content_text FROM ifu_documents d JOIN content_panels p ON d.id = p.document_id WHERE p.panel_type = ?"
     params = [panel_type]
-    all_panels_to_compare = conn.execute(base_query, tuple(params)).fetchall()
-    conn.close()
     results = []
     source_words = source_text.split()
-    for row in all_panels_to_compare:
-        target_words = row['content_text'].split()
-        matcher = difflib.SequenceMatcher(None, source_words, target_words, autojunk=False)
-        if 0.3 < matcher.ratio() < 0.999:
-            results.append({
-                "part_number": row['part_number'], "document_version": row['document_version'], "language": row['language'],
-                "similarity": round(matcher.ratio(), 4), "opcodes": matcher.get_opcodes(), "comparison_text": row['content_text']
-            })
+    try:
+        # Iterate the cursor directly so only the matching panels are ever held in memory.
+        for row in conn.execute(base_query, tuple(params)):
+            target_words = row['content_text'].split()
+            matcher = difflib.SequenceMatcher(None, source_words, target_words, autojunk=False)
+            # The quick ratios are cheap upper bounds on ratio(), so they can rule panels out early.
+            if matcher.real_quick_ratio() <= 0.3 or matcher.quick_ratio() <= 0.3:
+                continue
+            ratio = matcher.ratio()
+            if 0.3 < ratio < 0.999:
+                results.append({
+                    "part_number": row['part_number'], "document_version": row['document_version'], "language": row['language'],
+                    "similarity": round(ratio, 4), "opcodes": matcher.get_opcodes(), "comparison_text": row['content_text']
+                })
+    finally:
+        conn.close()
     results.sort(key=lambda x: x['similarity'], reverse=True)
-    return jsonify(results)
+    return json_response(results)
+
+@app.route('/api/panels/<int:panel_id>/cluster', methods=['GET'])
+def get_panel_cluster(panel_id):
+    """Returns the near-duplicate cluster for a panel, including the variants that deviate from its canonical text."""
+    conn = get_db_connection()
+    try:
+        cluster = content_clusters.get_panel_cluster(conn, panel_id)
+    except sqlite3.OperationalError:
+        cluster = None  # The clustering job has not been run against this database yet.
+    finally:
+        conn.close()
+    if not cluster:
+        return jsonify({"error": "No cluster found for this panel. Run content_clusters.py after loading."}), 404
+    return jsonify(cluster)
+
+@app.route('/api/sentences/usage', methods=['POST'])
+def find_sentence_usage():
+    """
+    Returns every IFU panel that carries a sentence, using the sentence index.
+    Set "fuzzy" to include near-identical variants of the sentence.
+    """
+    data = request.get_json()
+    sentence = data.get('sentence')
+    if not sentence:
+        return jsonify({"error": "Missing sentence"}), 400
+    conn = get_db_connection()
+    try:
+        result = sentence_index.find_sentence_usages(conn, sentence, fuzzy=bool(data.get('fuzzy')))
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"Sentence index unavailable: {e}"}), 500
+    finally:
+        conn.close()
+    return jsonify(result)
 
 # --- NEW ENDPOINT FOR DRAFTS ---
+_draft_schema_ready = False
+
+def ensure_draft_schema():
+    """Creates the draft panels table (moving any legacy JSON blobs into it) once per process."""
+    global _draft_schema_ready
+    if not _draft_schema_ready:
+        write_queue.execute(initialize_draft_panels)
+        _draft_schema_ready = True
+
 @app.route('/api/drafts', methods=['GET', 'POST'])
 def handle_drafts():
-    conn = get_db_connection()
+    """
+    - GET: The review queue, as draft headers only (with a panel_count); panels load per draft.
+    - POST: Submits a draft, storing its panels in content_draft_panels.
+    """
+    ensure_draft_schema()
     if request.method == 'POST':
         data = request.get_json()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO content_drafts (
-                request_id, status, created_by, created_at, content_panels, 
-                jira_key, request_summary, market, sample_type, consumables
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('request_id'), 'Pending Regulatory Review', 'Cintia (Content Team)',
-            datetime.now(), json.dumps(data.get('content_panels')),
-            data.get('jira_key'), data.get('request_summary'),
-            data.get('market'), data.get('sample_type'), data.get('consumables')
-        ))
-        conn.commit()
-        conn.close()
+
+        def insert_draft(cursor):
+            cursor.execute('''
+                INSERT INTO content_drafts (
+                    request_id, status, created_by, created_at,
+                    jira_key, request_summary, market, sample_type, consumables
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data.get('request_id'), 'Pending Regulatory Review', 'Cintia (Content Team)', datetime.now(),
+                data.get('jira_key'), data.get('request_summary'),
+                data.get('market'), data.get('sample_type'), data.get('consumables')
+            ))
+            draft_id = cursor.lastrowid
+            insert_draft_panels(cursor, draft_id, data.get('content_panels') or [])
+            draft = cursor.execute(f"SELECT {', '.join(DRAFT_HEADER_COLUMNS)} FROM content_drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+            return dict(draft, panel_count=cursor.execute('SELECT COUNT(*) FROM content_draft_panels WHERE draft_id = ?', (draft_id,)).fetchone()[0])
+
+        event_broker.publish('draft.created', write_queue.execute(insert_draft))
         return jsonify({"message": "Draft submitted for review successfully"}), 201
 
     if request.method == 'GET':
-        query = "SELECT * FROM content_drafts WHERE status = 'Pending Regulatory Review' ORDER BY created_at DESC"
-        drafts = conn.execute(query).fetchall()
+        conn = get_db_connection()
+        try:
+            return json_response(fetch_pending_draft_headers(conn))
+        finally:
+            conn.close()
+
+@app.route('/api/drafts/<int:draft_id>/panels', methods=['GET'])
+def get_draft_panels(draft_id):
+    """Returns the panels of one draft, in order."""
+    ensure_draft_schema()
+    conn = get_db_connection()
+    try:
+        if conn.execute('SELECT 1 FROM content_drafts WHERE draft_id = ?', (draft_id,)).fetchone() is None:
+            return jsonify({"error": "Draft not found"}), 404
+        return json_response(load_draft_panels(conn, draft_id))
+    finally:
         conn.close()
-        results = []
-        for row in drafts:
-            draft = dict(row)
-            draft['content_panels'] = json.loads(draft['content_panels']) if draft.get('content_panels') else []
-            results.append(draft)
-        return jsonify(results)
 
 @app.route('/api/drafts/<int:draft_id>/approve', methods=['POST'])
 def approve_draft(draft_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    def mark_approved(cursor):
         cursor.execute("UPDATE content_drafts SET status = ? WHERE draft_id = ?", ('Approved', draft_id))
-        conn.commit()
-        if cursor.rowcount == 0:
+        return cursor.rowcount
+
+    try:
+        if write_queue.execute(mark_approved) == 0:
              return jsonify({"error": "Draft not found"}), 404
+        event_broker.publish('draft.status', {"draft_id": draft_id, "status": 'Approved'})
         print(f"Draft #{draft_id} has been approved.")
         return jsonify({"message": f"Draft {draft_id} approved successfully"}), 200
     except sqlite3.Error as e:
-        conn.rollback()
         print(f"Database error during approval: {e}")
         return jsonify({"error": "A database error occurred"}), 500
-    finally:
-        conn.close()
 
 # --- NEW ENDPOINT FOR SURFACING BOM DATA THROUGHOUT WORKFLOW ---
 
@@ -297,33 +589,53 @@ def search_ifu_contents():
 
 
 # --- Dynamic dropdown data endpoints ---
+# Served from the ifu_facets table, which the BOM and stability importers rebuild at the end of each import.
+def facets_etag_source():
+    """ETag input for the dropdown endpoints: the version of the materialized facets."""
+    conn = get_db_connection()
+    try:
+        return f"facets-{facet_version(conn)}"
+    finally:
+        conn.close()
+
+def load_current_facets():
+    """Returns ({facet: raw JSON payload}, version), building the facets first if they never have been."""
+    conn = get_db_connection()
+    try:
+        payloads, version = load_facets(conn)
+        if version is None:
+            # The database was imported before the facet cache existed.
+            write_queue.execute(rebuild_facets)
+            payloads, version = load_facets(conn)
+    finally:
+        conn.close()
+    return payloads, version
+
+def facet_response(body, version):
+    response = Response(body, mimetype='application/json')
+    response.headers['X-Facets-Version'] = str(version)
+    return response
+
+@app.route('/api/facets', methods=['GET'])
+@conditional_get(facets_etag_source)
+def get_facets():
+    """Returns every dropdown facet (sample types, consumables, markets, kit codes) with its version."""
+    payloads, version = load_current_facets()
+    # The payloads are already JSON, so they are spliced in rather than decoded and re-encoded.
+    facets_body = ", ".join(f'"{facet}": {payload}' for facet, payload in sorted(payloads.items()))
+    return facet_response(f'{{"version": {version}, "facets": {{{facets_body}}}}}', version)
+
 @app.route('/api/structured-sample-types', methods=['GET'])
+@conditional_get(facets_etag_source)
 def get_structured_sample_types():
-    conn = get_db_connection()
-    rows = conn.execute("SELECT sample_type FROM ifu_documents WHERE sample_type IS NOT NULL").fetchall()
-    conn.close()
-    structured_types = defaultdict(set)
-    for row in rows:
-        try:
-            types = json.loads(row['sample_type'])
-            if len(types) > 1: structured_types[types[0]].add(types[1])
-            elif len(types) == 1: structured_types[types[0]].add("General")
-        except: structured_types[str(row['sample_type'])].add("General")
-    for key in structured_types: structured_types[key] = sorted(list(structured_types[key]))
-    return jsonify(structured_types)
+    payloads, version = load_current_facets()
+    return facet_response(payloads.get('sample_types', '{}'), version)
 
 @app.route('/api/consumables', methods=['GET'])
+@conditional_get(facets_etag_source)
 def get_consumables():
-    conn = get_db_connection()
-    rows = conn.execute('SELECT DISTINCT consumables FROM ifu_documents WHERE consumables IS NOT NULL').fetchall()
-    conn.close()
-    unique_consumables = set()
-    for row in rows:
-        try:
-            items = json.loads(row['consumables'])
-            for item in items: unique_consumables.add(item.strip())
-        except: pass
-    return jsonify(sorted(list(unique_consumables)))
+    payloads, version = load_current_facets()
+    return facet_response(payloads.get('consumables', '[]'), version)
 
     
     conn.commit()
@@ -337,6 +649,215 @@ def get_consumables():
     print(f"Draft #{draft_id} has been approved.")
     return jsonify({"message": f"Draft {draft_id} approved successfully"}), 200
 
+# --- Background ingestion ---
+# Uploads are spooled to disk by the request thread; everything after that runs on this pool.
+ingest_jobs = JobRegistry()
+PDF_INGEST_STAGES = ["upload", "select_layout", "extract", "load"]
+
+def upload_stream_and_filename():
+    """Returns (stream, filename) for an upload sent as a raw body (named by X-Filename or ?filename=) or as multipart field 'file'."""
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        return (upload.stream, upload.filename) if upload else (None, None)
+    return request.stream, request.headers.get('X-Filename') or request.args.get('filename')
+
+def run_pdf_ingest(job, pdf_path):
+    """Extracts and loads one uploaded IFU PDF, reporting each stage on the job."""
+    # Imported here, so the API starts without PyMuPDF and the importers' dependencies.
+    import PDF_extractor
+    import DB_importer_script_V2 as db_loader
+    filename = os.path.basename(pdf_path)
+
+    with job.stage('select_layout'):
+        layout = PDF_extractor.select_layout(filename, LAYOUT_CONFIG_FOLDER)
+        inferred = 'error' in layout
+        if inferred:
+            # No hand-made layout for this document: infer one from its fold marks and keep it for review.
+            import layout_inference
+            print(f"{filename}: {layout['error']} Inferring the layout instead.")
+            config = layout_inference.infer_layout(pdf_path)
+            if not config['panel_layout']:
+                raise IngestError(f"{layout['error']} No panels could be inferred either.")
+            layout = {"layout_key": None, "config": config,
+                      "layout_filename": layout_inference.save_layout(config, pdf_path, LAYOUT_CONFIG_FOLDER)}
+        job.set_detail('select_layout', {"layout_key": layout['layout_key'], "layout_filename": layout['layout_filename'],
+                                         "inferred": inferred, "panels": len(layout['config']['panel_layout'])})
+
+    with job.stage('extract'):
+        detected_columns = PDF_extractor.load_detected_columns(LAYOUT_CONFIG_FOLDER, layout['layout_filename'])
+        panel_data = PDF_extractor.parse_document_by_words_and_layout(pdf_path, layout['config'], detected_columns)
+        if 'error' in panel_data:
+            raise IngestError(panel_data['error'])
+        PDF_extractor.save_detected_columns(LAYOUT_CONFIG_FOLDER, layout['layout_filename'], detected_columns)
+        job.set_detail('extract', {"panels": len(panel_data)})
+
+    def load(cursor):
+        sentence_index.initialize_sentence_index(cursor)
+        # Panels are typed with the same layout they were extracted with, not looked up again.
+        return db_loader.load_document(cursor, filename, panel_data, LAYOUT_CONFIG_FOLDER, layout_config=layout['config'])
+
+    with job.stage('load'):
+        summary = write_queue.execute_bulk(load)
+        if 'skipped' in summary:
+            raise IngestError(summary['skipped'])
+        job.set_detail('load', {"documents": len(summary['documents'])})
+    print(f"Ingested {filename} as {summary['part_number']} {summary['document_version']}.")
+    return summary
+
+@app.route('/api/ingest/pdf', methods=['POST'])
+def ingest_pdf():
+    """
+    Accepts an IFU PDF, streamed to disk as it arrives, and returns 202 with a job ID straight
+    away. Layout selection (or inference, for documents with no hand-made layout), extraction
+    and the database load run in the background; poll /api/ingest/jobs/<job_id> for per-stage progress.
+    """
+    stream, filename = upload_stream_and_filename()
+    filename = secure_filename(filename or '')
+    if stream is None or not filename.lower().endswith('.pdf'):
+        return jsonify({"error": "Send a .pdf file, as the request body with an X-Filename header or as form field 'file'"}), 400
+
+    job = ingest_jobs.create('pdf', filename, PDF_INGEST_STAGES)
+    try:
+        with job.stage('upload'):
+            partial_path, size = spool_upload(stream, PDF_UPLOAD_FOLDER, MAX_PDF_UPLOAD_BYTES)
+            with open(partial_path, 'rb') as f:
+                is_pdf = f.read(5) == b'%PDF-'
+            if not is_pdf:
+                os.remove(partial_path)
+                raise IngestError("The upload is not a PDF file.")
+            pdf_path = os.path.join(PDF_UPLOAD_FOLDER, filename)
+            os.replace(partial_path, pdf_path)
+            job.set_detail('upload', {"bytes": size})
+    except IngestError as e:
+        job.fail(e)
+        return jsonify({"error": str(e), "job_id": job.id}), 413 if isinstance(e, UploadTooLarge) else 400
+
+    ingest_jobs.start(job, functools.partial(run_pdf_ingest, pdf_path=pdf_path))
+    return jsonify({"job_id": job.id, "status_url": f"/api/ingest/jobs/{job.id}"}), 202
+
+@app.route('/api/ingest/jobs', methods=['GET'])
+def list_ingest_jobs():
+    """The most recent upload jobs, newest first."""
+    return jsonify(ingest_jobs.recent())
+
+@app.route('/api/ingest/jobs/<string:job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """Status of one upload job: overall status, progress, each stage's status and timing, and the result or error."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+BOM_IMPORT_STAGES = ["upload", "parse", "update"]
+_transposed_bom_importer = None
+
+def transposed_bom_importer():
+    """The 'BOM importer.py' script as a module (its filename isn't importable with a plain import)."""
+    global _transposed_bom_importer
+    if _transposed_bom_importer is None:
+        spec = importlib.util.spec_from_file_location("transposed_bom_importer", os.path.join(os.path.dirname(os.path.abspath(__file__)), "BOM importer.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _transposed_bom_importer = module
+    return _transposed_bom_importer
+
+def detect_bom_format(workbook):
+    """'smart' for the full BOM (materials down, kits across), 'transposed' for the one-column-per-IFU sheet."""
+    import import_bom_data
+    return "smart" if import_bom_data.INTERNAL_SPEC_COL in workbook.frame().columns else "transposed"
+
+def run_bom_import(job, bom_path, bom_format):
+    """Parses an uploaded BOM and applies it to ifu_documents, then removes the upload."""
+    # Imported here, so the API starts without pandas, numpy and openpyxl.
+    import import_bom_data
+    from spreadsheet_cache import load_workbook
+    try:
+        with job.stage('parse'):
+            try:
+                workbook = load_workbook(bom_path, cache=False)
+            except Exception as e:
+                raise IngestError(f"Could not read the Excel file: {e}")
+            bom_format = bom_format or detect_bom_format(workbook)
+            try:
+                if bom_format == "smart":
+                    updates = import_bom_data.build_smart_bom_updates(workbook)
+                else:
+                    updates = transposed_bom_importer().build_transposed_bom_updates(workbook)
+            except (ValueError, KeyError) as e:
+                raise IngestError(f"Not a valid {bom_format} BOM: {e}")
+            job.set_detail('parse', {"format": bom_format, "updates": len(updates)})
+
+        with job.stage('update'):
+            # Applied in short transactions of its own rather than as one long write through the queue.
+            rows_updated, part_numbers, unmatched = 0, set(), set()
+            for start in range(0, len(updates), BOM_UPDATE_BATCH_SIZE):
+                batch = updates[start:start + BOM_UPDATE_BATCH_SIZE]
+                batch_rows, batch_parts, batch_unmatched = write_queue.execute_bulk(
+                    lambda cursor: import_bom_data.apply_bom_updates(cursor, batch))
+                rows_updated += batch_rows
+                part_numbers.update(batch_parts)
+                unmatched.update(batch_unmatched)
+                job.set_detail('update', {"rows_updated": rows_updated, "rows_total": len(updates)})
+            # Refresh the dropdown facets once the whole BOM is in.
+            write_queue.execute_bulk(rebuild_facets)
+            part_numbers, unmatched = sorted(part_numbers), sorted(unmatched)
+    finally:
+        os.remove(bom_path)
+    print(f"BOM import ({bom_format}) updated {rows_updated} IFU record(s) across {len(part_numbers)} part number(s).")
+    return {"format": bom_format, "rows_updated": rows_updated, "part_numbers": part_numbers, "unmatched_part_numbers": unmatched}
+
+@app.route('/api/upload_bom', methods=['POST'])
+def upload_bom():
+    """
+    Accepts a BOM .xlsx (raw body or form field 'file'), streamed to a temporary file, and
+    returns 202 with a job ID. The import runs in the background; the finished job lists the
+    part numbers it updated. ?format=smart|transposed overrides detection of the BOM layout.
+    """
+    bom_format = request.args.get('format')
+    if bom_format not in (None, "smart", "transposed"):
+        return jsonify({"error": "format must be 'smart' or 'transposed'"}), 400
+    stream, filename = upload_stream_and_filename()
+    filename = secure_filename(filename or 'bom.xlsx')
+    if stream is None or not filename.lower().endswith('.xlsx'):
+        return jsonify({"error": "Send an .xlsx file, as the request body or as form field 'file'"}), 400
+
+    job = ingest_jobs.create('bom', filename, BOM_IMPORT_STAGES)
+    try:
+        with job.stage('upload'):
+            bom_path, size = spool_upload(stream, BOM_UPLOAD_FOLDER, MAX_BOM_UPLOAD_BYTES, suffix='.xlsx')
+            with open(bom_path, 'rb') as f:
+                is_xlsx = f.read(4) == b'PK\x03\x04'  # .xlsx files are zip archives
+            if not is_xlsx:
+                os.remove(bom_path)
+                raise IngestError("The upload is not an .xlsx file.")
+            job.set_detail('upload', {"bytes": size})
+    except IngestError as e:
+        job.fail(e)
+        return jsonify({"error": str(e), "job_id": job.id}), 413 if isinstance(e, UploadTooLarge) else 400
+
+    ingest_jobs.start(job, functools.partial(run_bom_import, bom_path=bom_path, bom_format=bom_format))
+    return jsonify({"job_id": job.id, "status_url": f"/api/ingest/jobs/{job.id}"}), 202
+
+# --- Live updates ---
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events stream of committed changes, so the request queue and drafts review
+    screens can apply deltas instead of refetching: request.created, draft.created,
+    draft.status and approval.logged. A 'reset' event means the client must refetch in full.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(event_broker.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy buffer the stream.
+    return response
+
+# --- Metrics ---
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Exposes per-route latency, status counts, in-flight requests and SQL timings in Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # --- 5. Frontend serving ---
 
 @app.route('/', defaults={'path': ''})
@@ -350,68 +871,51 @@ def serve(path):
 
 # --- 6. Webhook Receivers --- #
     
+# Webhook bodies are spooled durably and drained into ifu_requests by a background worker.
+def publish_created_requests(request_ids):
+    """Announces the requests created from a drained batch of Jira events."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(f"SELECT * FROM ifu_requests WHERE request_id IN ({', '.join('?' * len(request_ids))})", request_ids).fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        event_broker.publish('request.created', dict(row))
+
+jira_spool = JiraSpool(DATABASE_FILE, write_queue=write_queue, on_applied=publish_created_requests)
+jira_spool.start()  # Drain anything left in the spool from before a restart, however the app is served.
+
 @app.route('/api/webhook/jira', methods=['POST'])
 def jira_webhook():
     """
-    Listens for Jira webhooks, parses the data including all BOM fields,
-    and creates a new request in the ifu_requests table.
+    Listens for Jira webhooks. The raw event is appended to a durable local spool and
+    acknowledged with 202 straight away; a background worker then creates the
+    ifu_requests rows in batches, ignoring redeliveries (see jira_spool.py).
     """
+    raw_payload = request.get_data(as_text=True)
     try:
-        # --- Start of Corrected Code ---
-
-        # 1. Extract data from the nested JSON payload
-        data = request.get_json()
-        issue_data = data.get('issue', {})
-        issue_fields = issue_data.get('fields', {})
-        creator_name = issue_fields.get('creator', {}).get('displayName', 'Unknown User')
-        created_timestamp = datetime.now() 
-
-        # 2. Prepare the values tuple for the database
-        # The order here MUST match the columns in the INSERT statement below
-        db_values = (
-    issue_fields.get('summary'),
-    'New IFU',  # request_type
-    issue_fields.get('issuetype', {}).get('name'),
-    issue_fields.get('project', {}).get('name'),
-    issue_fields.get('description'),
-    issue_fields.get('customfield_10016'),  # Market
-    issue_fields.get('customfield_10017'),  # Sample Type
-    issue_fields.get('customfield_10018'),  # Consumables
-    issue_fields.get('customfield_10019'),  # Kit Name
-    issue_fields.get('customfield_10020'),  # Dispatch Codes
-    issue_fields.get('customfield_10021'),  # Kit Codes
-    issue_fields.get('customfield_10022'),  # KPA Specimen Bag
-    issue_data.get('key'),                  # jira_key
-    'Pending Content Review',               # status
-    creator_name,                           # created_by
-    created_timestamp                       # created_at
-)
-
-        # 3. Connect to DB and execute the corrected INSERT statement
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-    INSERT INTO ifu_requests (
-        summary, request_type, issuetype, project, description, customfield_10016, 
-        customfield_10017, customfield_10018, customfield_10019, 
-        customfield_10020, customfield_10021, customfield_10022, 
-        jira_key, status, created_by, created_at
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-''', db_values)
-
-        conn.commit()
-        conn.close()
-
-        # --- End of Corrected Code ---
-
-        print(f"Successfully processed webhook for Jira ticket {issue_data.get('key')}.")
-        return jsonify({"status": "success"}), 200
-
-    except Exception as e:
+        payload = json.loads(raw_payload)
+    except ValueError as e:
         print(f"ERROR processing webhook: {e}")
+        return jsonify({"status": "error", "error": "Webhook body must be a JSON object"}), 400
+    # Reject what can never become a request here, rather than after it has been acknowledged.
+    problem = payload_problem(payload)
+    if problem is not None:
+        print(f"ERROR processing webhook: {problem}")
+        return jsonify({"status": "error", "error": f"Webhook {problem}"}), 400
+
+    try:
+        spool_id = jira_spool.append(raw_payload)
+    except sqlite3.Error as e:
+        print(f"ERROR spooling webhook: {e}")
         return jsonify({"status": "error", "error": str(e)}), 500
+
+    print(f"Spooled webhook for Jira ticket {payload['issue']['key']}.")
+    return jsonify({"status": "accepted", "spool_id": spool_id}), 202
     
 # --- 7. Main Execution Block ---
 if __name__ == '__main__':
     print("Starting Flask server for Stitch...")
+    if read_model is not None:
+        read_model.snapshot()  # Load the corpus into memory before the first request.
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,441 @@
+import sqlite3
+import re
+import hashlib
+import random
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- 1. Configuration ---
+DATABASE_FILE = "ifu_database.db"
+
+# Panels are compared on overlapping word triples, sentences on character 5-grams
+# (sentences are too short for word shingles to say much about similarity).
+PANEL_SHINGLE_WORDS = 3
+SENTENCE_SHINGLE_CHARS = 5
+
+# MinHash signature length and LSH banding. 16 bands of 4 rows means two texts
+# with a Jaccard similarity of 0.8 share a bucket with ~99.9% probability.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# Estimated Jaccard similarity at or above which two texts join the same cluster.
+SIMILARITY_THRESHOLD = 0.8
+
+LEVELS = ("panel", "sentence")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+if np is not None:
+    # Each multiplier split into 30 high and 31 low bits, so every product fits in 64 bits (see _permuted).
+    _PERM_A_HIGH = np.array([a >> 31 for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _PERM_A_LOW = np.array([a & 0x7FFFFFFF for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+
+
+# --- 2. Database Setup ---
+def initialize_cluster_tables(conn):
+    """Creates the cluster tables (and the hash index they join on) if they don't exist."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_clusters (
+            cluster_id INTEGER PRIMARY KEY AUTOINCREMENT, level TEXT NOT NULL,
+            canonical_hash TEXT NOT NULL, member_count INTEGER NOT NULL, updated_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_cluster_members (
+            level TEXT NOT NULL, content_hash TEXT NOT NULL, cluster_id INTEGER,
+            signature BLOB NOT NULL, sample_text TEXT, occurrences INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (level, content_hash)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_lsh_buckets (
+            level TEXT NOT NULL, band INTEGER NOT NULL, bucket INTEGER NOT NULL, content_hash TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_lsh_buckets ON content_lsh_buckets (level, band, bucket)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cluster_members_cluster ON content_cluster_members (cluster_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_panels_hash ON content_panels (content_hash)')
+    conn.commit()
+
+
+# --- 3. Text Normalization & Signature Helpers ---
+_QUOTE_MAP = str.maketrans({'‘': "'", '’': "'", '“': '"', '”': '"', '–': '-', '—': '-'})
+# Sentences end at terminal punctuation followed by a new capitalised sentence, or at a bullet.
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9¿¡"\'(])|\s*[•▪●■]\s*')
+
+
+def normalize_text(text):
+    """Lower-cases text and irons out quote, dash and whitespace differences."""
+    text = text.translate(_QUOTE_MAP).lower()
+    return ' '.join(text.split())
+
+
+def split_sentences(text):
+    """Splits panel text into sentences, returning (raw_sentence, normalized_sentence) pairs."""
+    sentences = []
+    for raw in _SENTENCE_BOUNDARY.split(text or ""):
+        raw = raw.strip()
+        normalized = normalize_text(raw).rstrip('.!?;: ')
+        if len(normalized) >= 3:
+            sentences.append((raw, normalized))
+    return sentences
+
+
+def sentence_hash(normalized_sentence):
+    """Generates a SHA-256 hash for a normalized sentence."""
+    return hashlib.sha256(normalized_sentence.encode('utf-8')).hexdigest()
+
+
+def shingles(text, level):
+    """Returns the set of shingles for a text at the given level."""
+    normalized = normalize_text(text)
+    if level == "panel":
+        words = normalized.split()
+        if len(words) <= PANEL_SHINGLE_WORDS:
+            return {' '.join(words)} if words else set()
+        return {' '.join(words[i:i + PANEL_SHINGLE_WORDS]) for i in range(len(words) - PANEL_SHINGLE_WORDS + 1)}
+    if len(normalized) <= SENTENCE_SHINGLE_CHARS:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SENTENCE_SHINGLE_CHARS] for i in range(len(normalized) - SENTENCE_SHINGLE_CHARS + 1)}
+
+
+def _mod_mersenne(values):
+    """values mod 2**61 - 1, for uint64 arrays."""
+    values = (values & np.uint64(_MERSENNE_PRIME)) + (values >> np.uint64(61))
+    return np.where(values >= np.uint64(_MERSENNE_PRIME), values - np.uint64(_MERSENNE_PRIME), values)
+
+
+def _permuted(base_hashes):
+    """
+    (a * h + b) mod 2**61 - 1 for every permutation (rows) and shingle hash (columns), exactly
+    as Python's big ints compute it: a * h is split as (a_high * 2**31 + a_low) * h, and the
+    2**31 shift is folded using 2**61 = 1 (mod 2**61 - 1).
+    """
+    h = np.asarray(base_hashes, dtype=np.uint64)[None, :]
+    high = _mod_mersenne(_PERM_A_HIGH * h)
+    shifted = (high >> np.uint64(30)) + ((high & np.uint64(0x3FFFFFFF)) << np.uint64(31))
+    return _mod_mersenne(_mod_mersenne(shifted) + _mod_mersenne(_PERM_A_LOW * h) + _PERM_B)
+
+
+def minhash_signature(text, level):
+    """Builds a MinHash signature (an array of 32-bit ints) for a text."""
+    base_hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles(text, level)] or [0]
+    if np is not None:
+        return array('I', (_permuted(base_hashes).min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32).tobytes())
+    return array('I', [
+        min((a * h + b) % _MERSENNE_PRIME for h in base_hashes) & 0xFFFFFFFF
+        for a, b in _PERMUTATIONS
+    ])
+
+
+def lsh_buckets(signature):
+    """Yields (band, bucket) pairs for a signature; similar signatures share at least one."""
+    for band in range(LSH_BANDS):
+        band_bytes = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        digest = hashlib.blake2b(band_bytes, digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'big', signed=True)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimates the Jaccard similarity of two texts from their signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERMUTATIONS
+
+
+def signature_from_blob(blob):
+    """Rebuilds a signature array from its stored BLOB."""
+    signature = array('I')
+    signature.frombytes(blob)
+    return signature
+
+
+def find_similar_hashes(conn, level, signature, threshold=SIMILARITY_THRESHOLD):
+    """
+    Looks up stored hashes whose signature is similar to the given one.
+    Returns a dict of content_hash -> estimated similarity.
+    """
+    buckets = list(lsh_buckets(signature))
+    # Joined from a VALUES list so each band is an exact (level, band, bucket) index lookup;
+    # OR-ing the bands together only let SQLite use the level prefix.
+    probes = ", ".join(["(?, ?)"] * len(buckets))
+    params = [value for pair in buckets for value in pair] + [level]
+    candidates = {row[0] for row in conn.execute(f'''
+        WITH probe(band, bucket) AS (VALUES {probes})
+        SELECT b.content_hash FROM probe JOIN content_lsh_buckets b
+          ON b.level = ? AND b.band = probe.band AND b.bucket = probe.bucket
+    ''', params)}
+    if not candidates:
+        return {}
+    placeholders = ",".join("?" * len(candidates))
+    rows = conn.execute(f'SELECT content_hash, signature FROM content_cluster_members WHERE level = ? AND content_hash IN ({placeholders})',
+                        [level] + list(candidates)).fetchall()
+    matches = {}
+    for content_hash, blob in rows:
+        similarity = estimate_similarity(signature, signature_from_blob(blob))
+        if similarity >= threshold:
+            matches[content_hash] = similarity
+    return matches
+
+
+class LSHIndex:
+    """
+    One level's LSH buckets and signatures held in memory, so a clustering run finds each
+    hash's candidates with dict lookups instead of a query per hash.
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+        self.keys = {}
+
+    @classmethod
+    def load(cls, conn, level):
+        index = cls()
+        for content_hash, blob in conn.execute('SELECT content_hash, signature FROM content_cluster_members WHERE level = ?', (level,)):
+            index.add(content_hash, signature_from_blob(blob))
+        return index
+
+    def add(self, content_hash, signature):
+        """Indexes a hash and returns its (band, bucket) pairs."""
+        keys = list(lsh_buckets(signature))
+        self.signatures[content_hash] = signature
+        self.keys[content_hash] = keys
+        for key in keys:
+            self.buckets[key].add(content_hash)
+        return keys
+
+    def similar_to(self, content_hash, threshold=SIMILARITY_THRESHOLD):
+        """What find_similar_hashes returns for an indexed hash, without touching the database."""
+        signature = self.signatures[content_hash]
+        candidates = set().union(*(self.buckets[key] for key in self.keys[content_hash]))
+        matches = {}
+        for candidate in candidates:
+            similarity = estimate_similarity(signature, self.signatures[candidate])
+            if similarity >= threshold:
+                matches[candidate] = similarity
+        return matches
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node):
+        self.parent.setdefault(node, node)
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+# --- 4. Corpus Collection ---
+def collect_corpus_hashes(conn):
+    """
+    Reads content_panels and returns, per level, a dict of
+    content_hash -> [sample_text, occurrences].
+    """
+    corpus = {level: {} for level in LEVELS}
+    for content_hash, text in conn.execute('SELECT content_hash, content_text FROM content_panels WHERE content_text IS NOT NULL'):
+        entry = corpus["panel"].setdefault(content_hash, [text, 0])
+        entry[1] += 1
+        for raw, normalized in split_sentences(text):
+            entry = corpus["sentence"].setdefault(sentence_hash(normalized), [raw, 0])
+            entry[1] += 1
+    return corpus
+
+
+# --- 5. Incremental Clustering ---
+def cluster_level(conn, level, current):
+    """
+    Brings the clusters for one level in line with the current corpus.
+    Only added hashes, and the members of clusters that lost a hash, are re-clustered.
+    """
+    cursor = conn.cursor()
+    stored = {row[0]: (row[1], row[2]) for row in cursor.execute(
+        'SELECT content_hash, cluster_id, occurrences FROM content_cluster_members WHERE level = ?', (level,))}
+
+    added = [h for h in current if h not in stored]
+    removed = [h for h in stored if h not in current]
+    recount = [(current[h][1], level, h) for h in current if h in stored and stored[h][1] != current[h][1]]
+
+    dirty_clusters = {stored[h][0] for h in removed}
+    recount_clusters = {stored[h][0] for _, _, h in recount}
+
+    # Drop hashes that no longer appear anywhere in the corpus.
+    cursor.executemany('DELETE FROM content_cluster_members WHERE level = ? AND content_hash = ?', [(level, h) for h in removed])
+    cursor.executemany('DELETE FROM content_lsh_buckets WHERE level = ? AND content_hash = ?', [(level, h) for h in removed])
+    cursor.executemany('UPDATE content_cluster_members SET occurrences = ? WHERE level = ? AND content_hash = ?', recount)
+
+    # The stored hashes' signatures and buckets, held in memory for this run's candidate lookups.
+    index = LSHIndex.load(conn, level)
+    # Sign and bucket the new hashes before looking anything up, so new-to-new matches are found too.
+    for content_hash in added:
+        text, occurrences = current[content_hash]
+        signature = minhash_signature(text, level)
+        keys = index.add(content_hash, signature)
+        cursor.execute('''
+            INSERT INTO content_cluster_members (level, content_hash, cluster_id, signature, sample_text, occurrences)
+            VALUES (?, ?, NULL, ?, ?, ?)
+        ''', (level, content_hash, signature.tobytes(), text, occurrences))
+        cursor.executemany('INSERT INTO content_lsh_buckets (level, band, bucket, content_hash) VALUES (?, ?, ?, ?)',
+                           [(level, band, bucket, content_hash) for band, bucket in keys])
+
+    # Everything in a dirty cluster has to be re-clustered, since the removed hash may have been the bridge.
+    to_cluster = set(added)
+    old_cluster_of = {}
+    if dirty_clusters:
+        placeholders = ",".join("?" * len(dirty_clusters))
+        for content_hash, cluster_id in cursor.execute(
+                f'SELECT content_hash, cluster_id FROM content_cluster_members WHERE level = ? AND cluster_id IN ({placeholders})',
+                [level] + list(dirty_clusters)).fetchall():
+            to_cluster.add(content_hash)
+            old_cluster_of[content_hash] = cluster_id
+
+    # Untouched clusters join the union-find as a single node each ("c:<id>").
+    union_find = _UnionFind()
+    for content_hash in to_cluster:
+        union_find.find(content_hash)
+        for match in index.similar_to(content_hash):
+            if match == content_hash:
+                continue
+            if match in to_cluster:
+                union_find.union(content_hash, match)
+                continue
+            # Anything else was already stored and kept its cluster this run.
+            union_find.union(content_hash, f"c:{stored[match][0]}")
+
+    components = defaultdict(lambda: {"hashes": [], "clusters": set()})
+    for node in list(union_find.parent):
+        component = components[union_find.find(node)]
+        if node.startswith("c:"):
+            component["clusters"].add(int(node[2:]))
+        else:
+            component["hashes"].append(node)
+            if node in old_cluster_of:
+                component["clusters"].add(old_cluster_of[node])
+
+    touched_clusters = set(recount_clusters)
+    used_ids = set()
+    for component in components.values():
+        candidates = sorted(c for c in component["clusters"] if c not in used_ids)
+        if candidates:
+            cluster_id = candidates[0]
+        else:
+            cursor.execute('INSERT INTO content_clusters (level, canonical_hash, member_count, updated_at) VALUES (?, ?, 0, ?)',
+                           (level, component["hashes"][0], datetime.now()))
+            cluster_id = cursor.lastrowid
+        used_ids.add(cluster_id)
+        touched_clusters.add(cluster_id)
+        # Merged stable clusters are folded into the chosen ID.
+        for other in component["clusters"]:
+            if other != cluster_id and other not in dirty_clusters:
+                cursor.execute('UPDATE content_cluster_members SET cluster_id = ? WHERE level = ? AND cluster_id = ?', (cluster_id, level, other))
+        cursor.executemany('UPDATE content_cluster_members SET cluster_id = ? WHERE level = ? AND content_hash = ?',
+                           [(cluster_id, level, h) for h in component["hashes"]])
+
+    # Retire cluster IDs that ended up with no members.
+    retired = (dirty_clusters | {c for comp in components.values() for c in comp["clusters"]}) - used_ids
+    cursor.executemany('DELETE FROM content_clusters WHERE cluster_id = ?', [(c,) for c in retired])
+    touched_clusters -= retired
+
+    # The canonical wording is the most widely used one (shortest, then lowest hash, on ties).
+    for cluster_id in touched_clusters:
+        members = cursor.execute('SELECT content_hash, occurrences, sample_text FROM content_cluster_members WHERE level = ? AND cluster_id = ?',
+                                 (level, cluster_id)).fetchall()
+        if not members:
+            cursor.execute('DELETE FROM content_clusters WHERE cluster_id = ?', (cluster_id,))
+            continue
+        canonical = min(members, key=lambda m: (-m[1], len(m[2] or ""), m[0]))[0]
+        cursor.execute('UPDATE content_clusters SET canonical_hash = ?, member_count = ?, updated_at = ? WHERE cluster_id = ?',
+                       (canonical, len(members), datetime.now(), cluster_id))
+
+    return {"added": len(added), "removed": len(removed), "reclustered": len(to_cluster), "clusters_touched": len(touched_clusters)}
+
+
+def run_clustering(db_file=DATABASE_FILE):
+    """Runs the incremental clustering job for every level in one transaction."""
+    conn = sqlite3.connect(db_file)
+    try:
+        initialize_cluster_tables(conn)
+        corpus = collect_corpus_hashes(conn)
+        summary = {}
+        for level in LEVELS:
+            print(f"Clustering {level}s ({len(corpus[level])} distinct hashes)...")
+            summary[level] = cluster_level(conn, level, corpus[level])
+            print(f"  -> {summary[level]}")
+        conn.commit()
+        return summary
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# --- 6. Lookups ---
+def get_panel_cluster(conn, panel_id):
+    """
+    Returns the cluster for a content panel: its canonical wording, every panel
+    sharing the cluster, and the members that deviate from the canonical text.
+    Returns None if the panel does not exist or has not been clustered yet.
+    """
+    panel = conn.execute('SELECT content_hash FROM content_panels WHERE id = ?', (panel_id,)).fetchone()
+    if not panel:
+        return None
+    member = conn.execute("SELECT cluster_id FROM content_cluster_members WHERE level = 'panel' AND content_hash = ?", (panel[0],)).fetchone()
+    if not member:
+        return None
+    cluster_id = member[0]
+    canonical_hash = conn.execute('SELECT canonical_hash FROM content_clusters WHERE cluster_id = ?', (cluster_id,)).fetchone()[0]
+
+    signatures = {row[0]: signature_from_blob(row[1]) for row in conn.execute(
+        "SELECT content_hash, signature FROM content_cluster_members WHERE level = 'panel' AND cluster_id = ?", (cluster_id,))}
+    rows = conn.execute('''
+        SELECT p.id AS panel_id, p.panel_number, p.panel_type, p.content_hash, p.content_text,
+               d.id AS document_id, d.part_number, d.document_version, d.language
+        FROM content_cluster_members m
+        JOIN content_panels p ON p.content_hash = m.content_hash
+        JOIN ifu_documents d ON d.id = p.document_id
+        WHERE m.level = 'panel' AND m.cluster_id = ?
+        ORDER BY d.part_number, d.document_version, p.panel_number
+    ''', (cluster_id,)).fetchall()
+
+    members, canonical_text = [], None
+    for row in rows:
+        entry = dict(zip(('panel_id', 'panel_number', 'panel_type', 'content_hash', 'content_text',
+                          'document_id', 'part_number', 'document_version', 'language'), row))
+        entry['is_canonical'] = entry['content_hash'] == canonical_hash
+        entry['similarity'] = round(estimate_similarity(signatures[entry['content_hash']], signatures[canonical_hash]), 4)
+        if entry['is_canonical']:
+            canonical_text = entry['content_text']
+        members.append(entry)
+
+    return {
+        "cluster_id": cluster_id,
+        "canonical": {"content_hash": canonical_hash, "content_text": canonical_text},
+        "members": members,
+        "variants": [m for m in members if not m['is_canonical']],
+    }
+
+
+# --- 7. Execution Block ---
+if __name__ == '__main__':
+    run_clustering()
+    print("\n--- Content clustering complete. ---")
@@ -0,0 +1,50 @@
+import sqlite3
+import os
+import threading
+
+
+class DataVersionWatcher:
+    """
+    Tracks whether the database has been written to, using SQLite's PRAGMA data_version.
+
+    data_version only changes when *another* connection commits, so the watcher keeps
+    one long-lived, read-only connection of its own and bumps a generation counter
+    whenever the value moves. The generation is prefixed with a per-process nonce, so
+    tokens handed out before a restart never match tokens handed out after it.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.generation = 0
+        self._nonce = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inode = None
+        self._last_version = None
+
+    def _file_inode(self):
+        try:
+            return os.stat(self.db_file).st_ino
+        except FileNotFoundError:
+            return None
+
+    def check(self):
+        """Polls the database and returns the current generation number."""
+        with self._lock:
+            inode = self._file_inode()
+            # A loader that rebuilt the DB file from scratch leaves us watching a deleted inode.
+            if self._conn is None or inode != self._inode:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+                self._inode = self._file_inode()
+                self._last_version = None
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._last_version:
+                self._last_version = version
+                self.generation += 1
+            return self.generation
+
+    def token(self):
+        """Returns an opaque string that changes whenever the database has been written to."""
+        return f"{self._nonce}-{self.check()}"
@@ -0,0 +1,85 @@
+import json
+
+# --- 1. Configuration ---
+PENDING_REVIEW_STATUS = "Pending Regulatory Review"
+# Columns of a draft header, i.e. everything in content_drafts except the legacy panels blob.
+DRAFT_HEADER_COLUMNS = ("draft_id", "request_id", "status", "created_by", "created_at",
+                        "jira_key", "request_summary", "market", "sample_type", "consumables")
+
+
+# --- 2. Database Setup ---
+def initialize_draft_panels(cursor):
+    """
+    Creates the content_draft_panels child table and the review-queue index, then moves
+    any panels still stored as a JSON blob in content_drafts.content_panels into it.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_draft_panels (
+            draft_id INTEGER NOT NULL, panel_number INTEGER NOT NULL, panel_type TEXT, content_text TEXT,
+            source_part_number TEXT, source_document_version TEXT,
+            PRIMARY KEY (draft_id, panel_number),
+            FOREIGN KEY (draft_id) REFERENCES content_drafts (draft_id)
+        )
+    ''')
+    # Only pending drafts are ever listed, so approved history doesn't grow the index the queue reads.
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_content_drafts_pending
+        ON content_drafts (created_at) WHERE status = '{PENDING_REVIEW_STATUS}'
+    ''')
+    migrated = migrate_draft_panel_blobs(cursor)
+    if migrated:
+        print(f"  -> Moved the panels of {migrated} draft(s) into 'content_draft_panels'.")
+
+
+def migrate_draft_panel_blobs(cursor):
+    """Explodes legacy content_panels blobs into content_draft_panels rows. Returns the number of drafts moved."""
+    legacy = cursor.execute('SELECT draft_id, content_panels FROM content_drafts WHERE content_panels IS NOT NULL').fetchall()
+    for draft_id, blob in legacy:
+        try:
+            panels = json.loads(blob)
+        except ValueError:
+            print(f"  -> WARNING: Draft #{draft_id} has unreadable content_panels JSON; leaving it in place.")
+            continue
+        cursor.execute('DELETE FROM content_draft_panels WHERE draft_id = ?', (draft_id,))
+        insert_draft_panels(cursor, draft_id, panels if isinstance(panels, list) else [])
+        cursor.execute('UPDATE content_drafts SET content_panels = NULL WHERE draft_id = ?', (draft_id,))
+    return len(legacy)
+
+
+# --- 3. Reads & Writes ---
+def insert_draft_panels(cursor, draft_id, panels):
+    """Stores a draft's panels (as posted by the content workbench), numbered in order."""
+    cursor.executemany('''
+        INSERT INTO content_draft_panels (draft_id, panel_number, panel_type, content_text, source_part_number, source_document_version)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (draft_id, number, panel.get('panel_type'), panel.get('content_text'), panel.get('part_number'), panel.get('document_version'))
+        for number, panel in enumerate((p for p in panels if isinstance(p, dict)), start=1)
+    ])
+
+
+def draft_panel_dict(row):
+    """Turns a content_draft_panels row back into the panel shape the frontend posted."""
+    return {
+        "panel_number": row['panel_number'], "panel_type": row['panel_type'], "content_text": row['content_text'],
+        "part_number": row['source_part_number'], "document_version": row['source_document_version'],
+    }
+
+
+def load_draft_panels(conn, draft_id):
+    """Returns a draft's panels in order."""
+    rows = conn.execute('SELECT * FROM content_draft_panels WHERE draft_id = ? ORDER BY panel_number', (draft_id,)).fetchall()
+    return [draft_panel_dict(row) for row in rows]
+
+
+def fetch_pending_draft_headers(conn):
+    """Returns the review queue: pending draft headers (no panels), newest first, each with its panel count."""
+    columns = ", ".join(f"d.{column}" for column in DRAFT_HEADER_COLUMNS)
+    # The status is inlined rather than bound so the planner can use the partial index.
+    rows = conn.execute(f'''
+        SELECT {columns}, (SELECT COUNT(*) FROM content_draft_panels p WHERE p.draft_id = d.draft_id) AS panel_count
+        FROM content_drafts d
+        WHERE d.status = '{PENDING_REVIEW_STATUS}'
+        ORDER BY d.created_at DESC
+    ''').fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,78 @@
+import os
+import json
+import threading
+from collections import deque
+
+# --- 1. Configuration ---
+# Recent events kept so a reconnecting client can catch up from its Last-Event-ID.
+HISTORY_SIZE = 1000
+# A comment line is sent this often so idle connections aren't closed by proxies.
+KEEPALIVE_SECONDS = 15
+# How long the browser waits before reconnecting after the stream drops.
+RETRY_MILLISECONDS = 3000
+
+
+class EventBroker:
+    """
+    In-process fan-out of change events to Server-Sent Events clients.
+
+    Write paths publish() a small JSON payload after their change is committed; every
+    open stream() picks it up. Event IDs carry a per-process nonce, so a client that
+    reconnects after a restart, or that fell further behind than the history holds,
+    gets a 'reset' event telling it to refetch in full rather than silently missing changes.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._nonce = os.urandom(4).hex()
+        self._sequence = 0
+        self._history = deque(maxlen=history_size)
+        self._condition = threading.Condition()
+
+    def publish(self, event_type, data):
+        """Sends an event to every connected client. Returns the event's sequence number."""
+        payload = json.dumps(data, default=str)
+        with self._condition:
+            self._sequence += 1
+            encoded = f"id: {self._nonce}-{self._sequence}\nevent: {event_type}\ndata: {payload}\n\n"
+            self._history.append((self._sequence, encoded))
+            self._condition.notify_all()
+            return self._sequence
+
+    def _resume_point(self, last_event_id):
+        """Returns the sequence number to resume after, or None if the client has to reset."""
+        nonce, _, sequence = (last_event_id or '').partition('-')
+        if nonce != self._nonce or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._history[0][0] if self._history else self._sequence + 1
+        # Everything after the client's last event must still be in the history.
+        if sequence > self._sequence or sequence < oldest - 1:
+            return None
+        return sequence
+
+    def stream(self, last_event_id=None):
+        """Yields the SSE body for one client, starting after last_event_id when given."""
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        with self._condition:
+            cursor = self._resume_point(last_event_id) if last_event_id else self._sequence
+            if cursor is None:
+                cursor = self._sequence
+                reset = f"id: {self._nonce}-{cursor}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                reset = None
+        if reset:
+            yield reset
+
+        while True:
+            with self._condition:
+                if self._sequence == cursor:
+                    self._condition.wait(KEEPALIVE_SECONDS)
+                oldest = self._history[0][0] if self._history else cursor + 1
+                if oldest > cursor + 1:
+                    # This client was too slow and events it hasn't seen were dropped.
+                    cursor = self._sequence
+                    pending = [f"id: {self._nonce}-{cursor}\nevent: reset\ndata: {{}}\n\n"]
+                else:
+                    pending = [encoded for sequence, encoded in self._history if sequence > cursor]
+                    cursor = self._sequence
+            yield ''.join(pending) if pending else ": keepalive\n\n"
@@ -0,0 +1,102 @@
+import sqlite3
+import json
+from collections import defaultdict
+from datetime import datetime
+
+# --- 1. Configuration ---
+# Facets materialized for the dropdown endpoints, and the ifu_documents column each is built from.
+FACET_COLUMNS = {
+    "sample_types": "sample_type",
+    "consumables": "consumables",
+    "markets": "market",
+    "kit_codes": "kit_code",
+}
+
+
+# --- 2. Database Setup ---
+def initialize_facet_cache(cursor):
+    """Creates the table holding the pre-built JSON payload of each facet."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ifu_facets (
+            facet TEXT PRIMARY KEY, payload TEXT NOT NULL, version INTEGER NOT NULL, built_at TIMESTAMP
+        )
+    ''')
+
+
+# --- 3. Parsing ---
+def parse_facet_values(raw_value):
+    """
+    Returns the values stored in one metadata cell as a list. The importers store either a
+    JSON list (BOM importer) or a plain string (the smart BOM import's sample type, market
+    and kit code), so anything that isn't JSON is treated as a single value.
+    """
+    if raw_value is None:
+        return []
+    try:
+        parsed = json.loads(raw_value)
+    except (ValueError, TypeError):
+        return [str(raw_value).strip()] if str(raw_value).strip() else []
+    if isinstance(parsed, list):
+        return [str(item).strip() for item in parsed if item is not None and str(item).strip()]
+    return [str(parsed).strip()] if str(parsed).strip() else []
+
+
+def build_sample_type_tree(raw_values):
+    """Groups sample types as {type: [sub-types]}; a type without a sub-type is listed as 'General'."""
+    tree = defaultdict(set)
+    for raw_value in raw_values:
+        types = parse_facet_values(raw_value)
+        if len(types) > 1:
+            tree[types[0]].add(types[1])
+        elif len(types) == 1:
+            tree[types[0]].add("General")
+    return {key: sorted(sub_types) for key, sub_types in sorted(tree.items())}
+
+
+def compute_facets(conn):
+    """Builds every facet from ifu_documents. Returns {facet: payload}."""
+    facets = {}
+    for facet, column in FACET_COLUMNS.items():
+        raw_values = [row[0] for row in conn.execute(f'SELECT DISTINCT {column} FROM ifu_documents WHERE {column} IS NOT NULL')]
+        if facet == "sample_types":
+            facets[facet] = build_sample_type_tree(raw_values)
+        else:
+            facets[facet] = sorted({value for raw_value in raw_values for value in parse_facet_values(raw_value)})
+    return facets
+
+
+# --- 4. Build & Lookup ---
+def rebuild_facets(cursor):
+    """
+    Rebuilds ifu_facets from ifu_documents under a new version number. Doesn't commit, so
+    an importer can call it just before its own commit and publish both together.
+    Returns the new version.
+    """
+    initialize_facet_cache(cursor)
+    version = cursor.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM ifu_facets').fetchone()[0]
+    facets = compute_facets(cursor.connection)
+    cursor.execute('DELETE FROM ifu_facets')
+    cursor.executemany('INSERT INTO ifu_facets (facet, payload, version, built_at) VALUES (?, ?, ?, ?)',
+                       [(facet, json.dumps(payload), version, datetime.now()) for facet, payload in facets.items()])
+    print(f"Rebuilt dropdown facets (version {version}): " +
+          ", ".join(f"{len(payload)} {facet}" for facet, payload in facets.items()))
+    return version
+
+
+def facet_version(conn):
+    """Returns the current facet version, or None if the facets have never been built."""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM ifu_facets').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0]
+
+
+def load_facets(conn, facets=None):
+    """Returns ({facet: raw JSON payload}, version), or ({}, None) if the facets have never been built."""
+    try:
+        rows = conn.execute('SELECT facet, payload, version FROM ifu_facets').fetchall()
+    except sqlite3.OperationalError:
+        return {}, None
+    payloads = {row[0]: row[1] for row in rows if facets is None or row[0] in facets}
+    return payloads, (rows[0][2] if rows else None)
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from collections import defaultdict
+
+from facet_cache import parse_facet_values
+
+# --- 1. Configuration ---
+# Filterable facets: query parameter -> ifu_documents column.
+FILTER_FACETS = {
+    "sample_type": "sample_type",
+    "market": "market",
+    "kit_code": "kit_code",
+    "dispatch_code": "dispatch_code",
+    "consumables": "consumables",
+    "stability_type": "stability_type",
+    "biomarkers": "biomarkers",
+}
+
+
+# --- 2. Index ---
+class FacetIndex:
+    """
+    An immutable bitmap index over ifu_documents. Each document has a bit position, and
+    each (facet, value) pair has a Python int with the bits of the documents carrying it
+    set, so a filter is a handful of ORs and ANDs over ints.
+
+    Values match case-insensitively; counts report each value as first spelled in the data.
+    """
+
+    def __init__(self, generation, documents, bitsets, display_names):
+        self.generation = generation
+        self.documents = documents
+        self.bitsets = bitsets
+        self.display_names = display_names
+        self.all_documents = (1 << len(documents)) - 1
+
+    def _facet_mask(self, facet, values):
+        """Documents matching any of the values of one facet."""
+        mask = 0
+        for value in values:
+            mask |= self.bitsets[facet].get(value.strip().casefold(), 0)
+        return mask
+
+    def query(self, filters):
+        """
+        filters is {facet: [values]}; values of one facet are ORed, facets are ANDed.
+        Returns (matching documents, {facet: {value: count}}). Each facet's counts ignore
+        that facet's own filter, so they show what selecting another value would return.
+        """
+        masks = {facet: self._facet_mask(facet, values) for facet, values in filters.items() if values}
+        matches = self.all_documents
+        for mask in masks.values():
+            matches &= mask
+
+        counts = {}
+        for facet, value_bitsets in self.bitsets.items():
+            scope = self.all_documents
+            for other_facet, mask in masks.items():
+                if other_facet != facet:
+                    scope &= mask
+            facet_counts = {}
+            for key, bitset in value_bitsets.items():
+                count = (bitset & scope).bit_count()
+                if count:
+                    facet_counts[self.display_names[facet][key]] = count
+            counts[facet] = facet_counts
+        return self.documents_for(matches), counts
+
+    def documents_for(self, bitset):
+        """Returns the documents whose bits are set, in index order."""
+        documents = []
+        while bitset:
+            lowest = bitset & -bitset
+            documents.append(self.documents[lowest.bit_length() - 1])
+            bitset ^= lowest
+        return documents
+
+
+def build_facet_index(conn, generation=0):
+    """Reads ifu_documents once and builds a FacetIndex over it."""
+    columns = ", ".join(FILTER_FACETS.values())
+    rows = conn.execute(f'SELECT id, part_number, document_version, language, {columns} FROM ifu_documents ORDER BY part_number, document_version, language').fetchall()
+    documents = []
+    bitsets = {facet: defaultdict(int) for facet in FILTER_FACETS}
+    display_names = {facet: {} for facet in FILTER_FACETS}
+    for position, row in enumerate(rows):
+        documents.append({"id": row[0], "part_number": row[1], "document_version": row[2], "language": row[3]})
+        bit = 1 << position
+        for offset, facet in enumerate(FILTER_FACETS, start=4):
+            for value in parse_facet_values(row[offset]):
+                key = value.casefold()
+                bitsets[facet][key] |= bit
+                display_names[facet].setdefault(key, value)
+    return FacetIndex(generation, documents, {facet: dict(values) for facet, values in bitsets.items()}, display_names)
+
+
+# --- 3. Cache ---
+class FacetIndexCache:
+    """Keeps a FacetIndex for the API, rebuilt whenever the DataVersionWatcher reports a write."""
+
+    def __init__(self, db_file, watcher):
+        self.db_file = db_file
+        self.watcher = watcher
+        self._index = None
+        self._build_lock = threading.Lock()
+
+    def index(self):
+        """Returns an index that is current as of this call."""
+        generation = self.watcher.check()
+        index = self._index
+        if index is not None and index.generation == generation:
+            return index
+        with self._build_lock:
+            if self._index is None or self._index.generation != generation:
+                conn = sqlite3.connect(self.db_file)
+                try:
+                    self._index = build_facet_index(conn, generation)
+                finally:
+                    conn.close()
+                print(f"Facet index rebuilt: {len(self._index.documents)} documents.")
+            return self._index
@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
 import json
+import sys
+from facet_cache import rebuild_facets
+from spreadsheet_cache import load_workbook
 
 # --- 1. Configuration ---
 # You MUST adjust these settings to match your BOM file's exact structure.
@@ -29,29 +33,17 @@ KIT_CODE_IDENTIFIER = "SAMPLE COLLECTION KIT CODE"
 DISPATCH_CODE_IDENTIFIER = "DISPATCH CODE"
 
 
-def import_smart_bom_data():
+def build_smart_bom_updates(workbook):
     """
-    Reads the complex BOM spreadsheet, correctly handles multiple header rows,
-    cross-references materials with kits, and updates the database.
+    Cross-references the BOM's materials with its kits. Returns the ifu_documents updates it
+    implies, in order, as (sample_type, market, dispatch_code, kit_code, consumables, part_number)
+    rows. Raises ValueError if the kit and dispatch code rows can't be found.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    bom_path = os.path.join(script_dir, BOM_FILENAME)
-    if not os.path.exists(bom_path):
-        print(f"ERROR: BOM file not found at '{bom_path}'")
-        return
-
-    print("Reading BOM data...")
-    # Read the data twice to handle the different header rows correctly
-    try:
-        # Read the sheet once, without assuming a header, to find the special rows
-        df_raw = pd.read_excel(bom_path, header=None)
-        
-        # Read it again, this time with the correct material headers
-        df_materials = pd.read_excel(bom_path, header=MATERIAL_HEADERS_ROW)
-
-    except Exception as e:
-        print(f"ERROR: Could not read Excel file. Please ensure it is not password protected. Details: {e}")
-        return
+    # The sheet without assuming a header, to find the special rows
+    df_raw = workbook.frame(header=None)
+    
+    # The same sheet with the correct material headers
+    df_materials = workbook.frame(header=MATERIAL_HEADERS_ROW)
 
     # --- Stage 1: Process the horizontal Kit and Dispatch Codes ---
     print("Processing Kit and Dispatch codes...")
@@ -66,10 +58,8 @@ def import_smart_bom_data():
     kit_code_row_df = df_raw[search_column == KIT_CODE_IDENTIFIER]
     
     if dispatch_row_df.empty or kit_code_row_df.empty:
-        # Corrected the error message to be more helpful
-        print("FATAL ERROR: Could not find the 'DISPATCH CODE' or 'SAMPLE COLLECTION KIT CODE' identifier rows.")
-        print(f"Please check that the text '{DISPATCH_CODE_IDENTIFIER}' and '{KIT_CODE_IDENTIFIER}' exist in the first column of your spreadsheet.")
-        return
+        raise ValueError(f"Could not find the '{DISPATCH_CODE_IDENTIFIER}' or '{KIT_CODE_IDENTIFIER}' identifier rows. "
+                         f"Please check that both exist in the first column of the spreadsheet.")
 
     dispatch_row = dispatch_row_df.iloc[0]
     kit_code_row = kit_code_row_df.iloc[0]
@@ -92,14 +82,22 @@ def import_smart_bom_data():
     
     db_updates = {}
 
-    for index, row in df_materials_clean.iterrows():
-        spec_num = str(row[INTERNAL_SPEC_COL]).strip()
-        material_name = str(row[MATERIAL_NAME_COL])
-        
-        kits_for_this_material = []
-        for kit_name in kit_lookup.keys():
-            if kit_name in row and row[kit_name] == 1:
-                kits_for_this_material.append(kit_name)
+    # Kit membership as one boolean matrix: one row per material, one column per kit.
+    kit_names = list(kit_lookup.keys())
+    membership = (df_materials_clean[kit_names] == 1).to_numpy()
+
+    # Each kit's consumables (its materials, in BOM order) are computed once, not once per member.
+    consumable_names = df_materials_clean[MATERIAL_NAME_COL].tolist()
+    kit_consumables = {
+        kit_name: json.dumps([consumable_names[i] for i in np.flatnonzero(membership[:, k])])
+        for k, kit_name in enumerate(kit_names)
+    }
+
+    spec_numbers = df_materials_clean[INTERNAL_SPEC_COL].astype(str).str.strip().tolist()
+    material_names = df_materials_clean[MATERIAL_NAME_COL].astype(str).tolist()
+
+    for spec_num, material_name, kit_flags in zip(spec_numbers, material_names, membership):
+        kits_for_this_material = [kit_names[k] for k in np.flatnonzero(kit_flags)]
         
         sample_type = "Unknown"
         if "IFU" in spec_num:
@@ -110,39 +108,74 @@ def import_smart_bom_data():
 
         for kit_name in kits_for_this_material:
             kit_info = kit_lookup.get(kit_name, {})
-            consumable_list = df_materials_clean[df_materials_clean[kit_name] == 1][MATERIAL_NAME_COL].tolist()
             update_key = (spec_num, kit_info.get('kit_code'))
             db_updates[update_key] = {
                 "part_number": spec_num, "sample_type": sample_type, "market": "US", # Placeholder for market
                 "dispatch_code": kit_info.get('dispatch_code'), "kit_code": kit_info.get('kit_code'),
-                "consumables": json.dumps(consumable_list)
+                "consumables": kit_consumables[kit_name]
             }
 
+    return [
+        (data['sample_type'], data['market'], data['dispatch_code'], data['kit_code'], data['consumables'], data['part_number'])
+        for data in db_updates.values() if "IFU" in data["part_number"]
+    ]
+
+
+def apply_bom_updates(cursor, updates):
+    """
+    Writes BOM-derived metadata onto ifu_documents, in order, with one executemany. updates
+    are (sample_type, market, dispatch_code, kit_code, consumables, part_number) rows, as built
+    by either BOM importer. Returns (rows updated, part numbers updated, part numbers not in the DB).
+    """
+    known_parts = {row[0] for row in cursor.execute('SELECT DISTINCT part_number FROM ifu_documents')}
+    cursor.executemany('''
+        UPDATE ifu_documents
+        SET sample_type = ?, market = ?, dispatch_code = ?, kit_code = ?, consumables = ?
+        WHERE part_number = ?
+    ''', updates)
+    part_numbers = {update[-1] for update in updates}
+    return cursor.rowcount, sorted(part_numbers & known_parts), sorted(part_numbers - known_parts)
+
+
+def import_smart_bom_data():
+    """
+    Reads the complex BOM spreadsheet, correctly handles multiple header rows,
+    cross-references materials with kits, and updates the database. Returns False on a fatal error.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    bom_path = os.path.join(script_dir, BOM_FILENAME)
+    if not os.path.exists(bom_path):
+        print(f"ERROR: BOM file not found at '{bom_path}'")
+        return False
+
+    print("Reading BOM data...")
+    # Parse the workbook once (or load the cached parse) and take both views from it
+    try:
+        workbook = load_workbook(bom_path)
+        updates = build_smart_bom_updates(workbook)
+    except ValueError as e:
+        print(f"FATAL ERROR: {e}")
+        return False
+    except Exception as e:
+        print(f"ERROR: Could not read Excel file. Please ensure it is not password protected. Details: {e}")
+        return False
+
     # --- Stage 3: Update the database ---
     print("\nUpdating the database...")
     conn = sqlite3.connect(DATABASE_FILENAME)
     cursor = conn.cursor()
-    update_count = 0
 
-    for key, data in db_updates.items():
-        if "IFU" not in data["part_number"]:
-            continue
-            
-        print(f"  -> Updating data for Part Number: {data['part_number']}")
-        cursor.execute('''
-            UPDATE ifu_documents
-            SET sample_type = ?, market = ?, dispatch_code = ?, kit_code = ?, consumables = ?
-            WHERE part_number = ?
-        ''', (
-            data['sample_type'], data['market'], data['dispatch_code'], 
-            data['kit_code'], data['consumables'], data['part_number']
-        ))
-        if cursor.rowcount > 0:
-            update_count += cursor.rowcount
+    for update in updates:
+        print(f"  -> Updating data for Part Number: {update[-1]}")
+    update_count, _, _ = apply_bom_updates(cursor, updates)
 
+    # Refresh the dropdown facets in the same transaction as the import.
+    rebuild_facets(cursor)
     conn.commit()
     conn.close()
     print(f"\n--- Smart BOM Import Complete. Updated {update_count} database entries. ---")
+    return True
 
 if __name__ == '__main__':
-    import_smart_bom_data()
+    if not import_smart_bom_data():
+        sys.exit(1)
@@ -0,0 +1,169 @@
+import os
+import time
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- 1. Configuration ---
+# How many uploads are processed at once; the rest wait their turn in the pool's queue.
+DEFAULT_WORKERS = 2
+# Finished jobs kept for status polling; the oldest are forgotten first.
+MAX_FINISHED_JOBS = 200
+# Upload bodies are copied to disk in chunks of this size, never read into memory whole.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+PENDING, DONE = "pending", "done"
+
+
+class IngestError(Exception):
+    """A job step that cannot continue. The message is reported to the client as the job's error."""
+
+
+class UploadTooLarge(IngestError):
+    pass
+
+
+# --- 2. Uploads ---
+def spool_upload(stream, folder, max_bytes, suffix=".part", chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Copies an upload stream to a new temporary file in `folder`, chunk by chunk, and returns
+    (path, size). The caller moves or removes the file. Raises UploadTooLarge (after removing
+    the partial file) if the body exceeds max_bytes.
+    """
+    os.makedirs(folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit.")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+# --- 3. Jobs ---
+class IngestJob:
+    """
+    One background upload job and its named stages. Stages are reported in order, each
+    with its status and timing, so clients can show progress while the job runs.
+    """
+
+    def __init__(self, kind, filename, stage_names, lock):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = QUEUED
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.stages = OrderedDict((name, {"status": PENDING, "started_at": None, "duration_ms": None, "detail": None})
+                                  for name in stage_names)
+        self._lock = lock
+
+    @contextmanager
+    def stage(self, name):
+        """Marks a stage running for the duration of the block, then done (or failed if it raised)."""
+        started = time.perf_counter()
+        with self._lock:
+            self.stages[name].update(status=RUNNING, started_at=datetime.now().isoformat())
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self.stages[name].update(status=FAILED, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+            raise
+        with self._lock:
+            self.stages[name].update(status=DONE, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+    def set_detail(self, name, detail):
+        """Attaches a short, JSON-serializable note (e.g. the layout chosen) to a stage."""
+        with self._lock:
+            self.stages[name]["detail"] = detail
+
+    def fail(self, error):
+        with self._lock:
+            self.status = FAILED
+            self.error = str(error)
+            self.finished_at = datetime.now()
+
+    def to_dict(self):
+        with self._lock:
+            done = sum(1 for stage in self.stages.values() if stage["status"] == DONE)
+            return {
+                "job_id": self.id, "kind": self.kind, "filename": self.filename, "status": self.status,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "progress": round(done / len(self.stages), 2) if self.stages else 1.0,
+                "stages": [dict(stage, name=name) for name, stage in self.stages.items()],
+                "result": self.result, "error": self.error,
+            }
+
+
+class JobRegistry:
+    """
+    Runs upload jobs on a small worker pool, off the web request threads, and keeps their
+    state in memory for status polling. Jobs don't survive a restart.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_finished=MAX_FINISHED_JOBS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def create(self, kind, filename, stage_names):
+        """Registers a job without starting it, so the request thread can report its own stages (e.g. the upload)."""
+        job = IngestJob(kind, filename, stage_names, self._lock)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+        return job
+
+    def start(self, job, work):
+        """Queues work(job) on the pool. Its return value becomes the job's result."""
+        self._pool.submit(self._run, job, work)
+
+    def _run(self, job, work):
+        with self._lock:
+            job.status = RUNNING
+        try:
+            result = work(job)
+        except IngestError as e:
+            job.fail(e)
+        except Exception as e:
+            print(f"ERROR in {job.kind} job {job.id} ({job.filename}): {e}")
+            job.fail(f"Unexpected error: {e}")
+        else:
+            with self._lock:
+                job.result = result
+                job.status = SUCCEEDED
+                job.finished_at = datetime.now()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def recent(self, limit=50):
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
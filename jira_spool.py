@@ -0,0 +1,244 @@
+import sqlite3
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+# --- 1. Configuration ---
+# The spool lives in its own SQLite file so that accepting a webhook never waits
+# on the main database's writer lock.
+SPOOL_DATABASE_FILE = "jira_spool.db"
+DRAIN_BATCH_SIZE = 100
+# How often the worker checks the spool even when nothing has woken it up.
+DRAIN_POLL_SECONDS = 5.0
+
+
+# --- 2. Database Setup ---
+def _connect_spool(spool_file):
+    conn = sqlite3.connect(spool_file, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')  # An acknowledged event must survive a power cut.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jira_event_spool (
+            spool_id INTEGER PRIMARY KEY AUTOINCREMENT, received_at TIMESTAMP NOT NULL, payload TEXT NOT NULL
+        )
+    ''')
+    # Events that can never become a request are parked here instead of blocking the spool.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jira_event_dead_letter (
+            spool_id INTEGER PRIMARY KEY, received_at TIMESTAMP NOT NULL, payload TEXT NOT NULL,
+            error TEXT NOT NULL, failed_at TIMESTAMP NOT NULL
+        )
+    ''')
+    return conn
+
+
+def initialize_processed_events(cursor):
+    """Creates the table that makes redelivered Jira events idempotent."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jira_processed_events (
+            jira_key TEXT NOT NULL, event_timestamp TEXT NOT NULL, processed_at TIMESTAMP,
+            PRIMARY KEY (jira_key, event_timestamp)
+        )
+    ''')
+
+
+# --- 3. Payload Mapping ---
+def payload_problem(payload):
+    """Returns why a decoded webhook payload cannot become an ifu_requests row, or None if it can."""
+    if not isinstance(payload, dict):
+        return "payload is not a JSON object"
+    issue = payload.get('issue')
+    if not isinstance(issue, dict):
+        return "payload has no 'issue' object"
+    if not isinstance(issue.get('key'), str) or not issue['key']:
+        return "issue has no 'key'"
+    if not isinstance(issue.get('fields'), dict):
+        return "issue has no 'fields' object"
+    return None
+
+
+def _object_field(container, name):
+    """Returns container[name] when it is a JSON object; Jira sends null for unset objects."""
+    value = container.get(name)
+    return value if isinstance(value, dict) else {}
+
+
+def event_identity(payload, raw_payload):
+    """
+    Returns the (jira_key, event_timestamp) pair an event is deduplicated on. Jira sends a
+    millisecond 'timestamp' with every webhook; a hash of the body stands in if it is missing.
+    """
+    jira_key = payload.get('issue', {}).get('key') or ''
+    timestamp = payload.get('timestamp')
+    if timestamp is None:
+        timestamp = hashlib.sha256(raw_payload.encode('utf-8')).hexdigest()
+    return jira_key, str(timestamp)
+
+
+def build_request_values(payload, received_at):
+    """Maps a Jira webhook payload onto the ifu_requests columns inserted by apply_spooled_events."""
+    issue_data = payload['issue']
+    issue_fields = issue_data['fields']
+    creator_name = _object_field(issue_fields, 'creator').get('displayName') or 'Unknown User'
+
+    # The order here MUST match the columns in the INSERT statement below
+    return (
+        issue_fields.get('summary'),
+        'New IFU',  # request_type
+        _object_field(issue_fields, 'issuetype').get('name'),
+        _object_field(issue_fields, 'project').get('name'),
+        issue_fields.get('description'),
+        issue_fields.get('customfield_10016'),  # Market
+        issue_fields.get('customfield_10017'),  # Sample Type
+        issue_fields.get('customfield_10018'),  # Consumables
+        issue_fields.get('customfield_10019'),  # Kit Name
+        issue_fields.get('customfield_10020'),  # Dispatch Codes
+        issue_fields.get('customfield_10021'),  # Kit Codes
+        issue_fields.get('customfield_10022'),  # KPA Specimen Bag
+        issue_data.get('key'),                  # jira_key
+        'Pending Content Review',               # status
+        creator_name,                           # created_by
+        received_at                             # created_at
+    )
+
+
+def apply_spooled_events(cursor, events):
+    """
+    Inserts an ifu_requests row for each spooled event that has not been processed before.
+    events is a list of (spool_id, received_at, raw_payload). Each event is applied in its own
+    SAVEPOINT, so a bad one is rolled back without holding up the rest of the batch.
+    Returns (inserted request IDs, [(spool_id, error)] for events that can never be applied).
+    """
+    initialize_processed_events(cursor)
+    inserted, rejected = [], []
+    for spool_id, received_at, raw_payload in events:
+        try:
+            payload = json.loads(raw_payload)
+            problem = payload_problem(payload)
+        except ValueError:
+            problem = "not valid JSON"
+        if problem is not None:
+            print(f"  -> REJECTED: Spooled Jira event {spool_id}: {problem}.")
+            rejected.append((spool_id, problem))
+            continue
+
+        jira_key, event_timestamp = event_identity(payload, raw_payload)
+        cursor.execute('SAVEPOINT jira_event')
+        try:
+            cursor.execute('INSERT OR IGNORE INTO jira_processed_events (jira_key, event_timestamp, processed_at) VALUES (?, ?, ?)',
+                           (jira_key, event_timestamp, datetime.now()))
+            if cursor.rowcount == 0:
+                print(f"  -> Duplicate delivery of Jira event {jira_key} @ {event_timestamp} ignored.")
+            else:
+                cursor.execute('''
+                    INSERT INTO ifu_requests (
+                        summary, request_type, issuetype, project, description, customfield_10016,
+                        customfield_10017, customfield_10018, customfield_10019,
+                        customfield_10020, customfield_10021, customfield_10022,
+                        jira_key, status, created_by, created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', build_request_values(payload, received_at))
+                inserted.append(cursor.lastrowid)
+            cursor.execute('RELEASE SAVEPOINT jira_event')
+        except (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError) as e:
+            # The event itself is at fault (e.g. a field Jira sent as an object); anything else,
+            # such as a locked database, propagates so the whole batch is retried.
+            cursor.execute('ROLLBACK TO SAVEPOINT jira_event')
+            cursor.execute('RELEASE SAVEPOINT jira_event')
+            print(f"  -> REJECTED: Spooled Jira event {spool_id} ({jira_key}): {e}")
+            rejected.append((spool_id, str(e)))
+    return inserted, rejected
+
+
+# --- 4. Spool & Background Worker ---
+class JiraSpool:
+    """
+    Durable queue between the Jira webhook and the database. append() makes the raw
+    event durable and returns straight away; a background thread drains the spool in
+    batches, applying each batch to the main database in a single transaction
+    (through the API's WriteQueue when one is given). on_applied, if given, is called
+    with the IDs of the requests created by each committed batch. Events that can never
+    be applied are moved to the jira_event_dead_letter table of the spool.
+    """
+
+    def __init__(self, db_file, spool_file=SPOOL_DATABASE_FILE, write_queue=None, on_applied=None):
+        self.db_file = db_file
+        self.spool_file = spool_file
+        self.write_queue = write_queue
+        self.on_applied = on_applied
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def append(self, raw_payload):
+        """Durably spools one raw webhook body and returns its spool ID."""
+        conn = _connect_spool(self.spool_file)
+        try:
+            cursor = conn.execute('INSERT INTO jira_event_spool (received_at, payload) VALUES (?, ?)', (datetime.now(), raw_payload))
+            conn.commit()
+            spool_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self.start()
+        self._wakeup.set()
+        return spool_id
+
+    def start(self):
+        """Starts the drain worker if it is not already running (it also picks up events left from a restart)."""
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="jira-spool-drain", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                while self.drain_once() == DRAIN_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                print(f"ERROR draining Jira spool: {e}")
+            self._wakeup.wait(DRAIN_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def apply_batch(self, events):
+        """Applies a batch of spooled events to the main database in one transaction."""
+        if self.write_queue is not None:
+            return self.write_queue.execute(lambda cursor: apply_spooled_events(cursor, events))
+        # Transactions are managed by hand so the per-event SAVEPOINTs nest inside this one.
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            outcome = apply_spooled_events(conn.cursor(), events)
+            conn.execute('COMMIT')
+            return outcome
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def drain_once(self):
+        """Moves up to DRAIN_BATCH_SIZE events into the database. Returns how many were drained."""
+        spool = _connect_spool(self.spool_file)
+        try:
+            rows = spool.execute('SELECT spool_id, received_at, payload FROM jira_event_spool ORDER BY spool_id LIMIT ?',
+                                 (DRAIN_BATCH_SIZE,)).fetchall()
+            if not rows:
+                return 0
+            inserted, rejected = self.apply_batch(rows)
+            # If we crash before this commit, the batch is redelivered and deduplicated on the way in.
+            failed_at = datetime.now()
+            spooled = {spool_id: (received_at, payload) for spool_id, received_at, payload in rows}
+            spool.executemany('INSERT OR REPLACE INTO jira_event_dead_letter (spool_id, received_at, payload, error, failed_at) VALUES (?, ?, ?, ?, ?)',
+                              [(spool_id, *spooled[spool_id], error, failed_at) for spool_id, error in rejected])
+            spool.execute('DELETE FROM jira_event_spool WHERE spool_id <= ?', (rows[-1][0],))
+            spool.commit()
+            print(f"Drained {len(rows)} Jira event(s) from the spool; created {len(inserted)} request(s), "
+                  f"dead-lettered {len(rejected)}.")
+            if inserted and self.on_applied is not None:
+                self.on_applied(inserted)
+            return len(rows)
+        finally:
+            spool.close()
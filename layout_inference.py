@@ -0,0 +1,367 @@
+import fitz  # PyMuPDF
+import os
+import re
+import json
+import argparse
+from collections import namedtuple
+import numpy as np
+
+# --- 1. Configuration ---
+LAYOUT_CONFIG_FOLDER = "LAYOUT_CONFIGS"
+
+# Printer's marks (crop and fold ticks) are short strokes in the slug, outside the trim box.
+MARK_MIN_LENGTH = 3.0
+MARK_MAX_LENGTH = 40.0
+# Ticks closer together than this (in points) mark the same fold, e.g. a solid and a dashed tick.
+MARK_CLUSTER_TOLERANCE = 1.5
+# Without a /TrimBox, crop marks are looked for in this outer fraction of the page.
+SLUG_BAND = 0.15
+# A drawn panel border runs at least this fraction of the trim height (or width).
+BORDER_MIN_SPAN = 0.9
+# Word gutters: empty vertical strips at least this wide can be folds, if every panel stays this wide.
+GUTTER_MIN_WIDTH = 12.0
+MIN_PANEL_SIZE = 200.0
+PROFILE_RESOLUTION = 1.0  # points per histogram bin
+# Text columns inside a panel: a valley must be this wide, and may be crossed by up to this share
+# of the busiest bin's words (e.g. a heading spanning both columns). Each column needs this share of the words.
+COLUMN_GAP_MIN_WIDTH = 5.0
+COLUMN_VALLEY_SHARE = 0.05
+MIN_COLUMN_SHARE = 0.1
+
+# Used to guess panel_types for an inferred layout; the same pattern the loader reads metadata with.
+PART_NUMBER_PATTERN = re.compile(r'(?:QR-)?IFU-\d+[-\s]+R[A-Z0-9]+', re.IGNORECASE)
+ENGLISH_WORDS = {"the", "and", "to", "of", "your", "with", "for", "this", "is", "do", "not", "into"}
+SPANISH_WORDS = {"el", "la", "los", "las", "y", "de", "del", "para", "con", "su", "que", "no", "una"}
+
+Segment = namedtuple("Segment", "axis position start end solid")
+
+
+# --- 2. Geometry Helpers ---
+def line_segments(page):
+    """The page's straight, axis-aligned vector strokes. 'v' segments sit at an x position, 'h' at a y."""
+    segments = []
+    for path in page.get_cdrawings():
+        solid = str(path.get("dashes") or "[] 0").startswith("[]")
+        for item in path["items"]:
+            if item[0] != "l":
+                continue
+            (x0, y0), (x1, y1) = item[1], item[2]
+            if abs(x0 - x1) < 0.5:
+                segments.append(Segment("v", (x0 + x1) / 2, min(y0, y1), max(y0, y1), solid))
+            elif abs(y0 - y1) < 0.5:
+                segments.append(Segment("h", (y0 + y1) / 2, min(x0, x1), max(x0, x1), solid))
+    return segments
+
+
+def _is_mark(segment):
+    return MARK_MIN_LENGTH <= segment.end - segment.start <= MARK_MAX_LENGTH
+
+
+def page_trim_box(page, segments):
+    """
+    The finished (trimmed) area of the page: its /TrimBox if the PDF has one, otherwise the
+    box spanned by the crop marks in the slug, otherwise the whole page.
+    """
+    page_rect = page.rect
+    trim = page.trimbox
+    if trim != page_rect and page_rect.contains(trim) and not trim.is_empty:
+        return fitz.Rect(trim)
+
+    top, bottom = page_rect.y0 + SLUG_BAND * page_rect.height, page_rect.y1 - SLUG_BAND * page_rect.height
+    left, right = page_rect.x0 + SLUG_BAND * page_rect.width, page_rect.x1 - SLUG_BAND * page_rect.width
+    xs = [s.position for s in segments if s.axis == "v" and _is_mark(s) and (s.end <= top or s.start >= bottom)]
+    ys = [s.position for s in segments if s.axis == "h" and _is_mark(s) and (s.end <= left or s.start >= right)]
+    if len(xs) >= 2 and len(ys) >= 2:
+        return fitz.Rect(min(xs), min(ys), max(xs), max(ys))
+    return fitz.Rect(page_rect)
+
+
+def cluster_positions(candidates, tolerance=MARK_CLUSTER_TOLERANCE):
+    """
+    Groups (position, solid) candidates that lie within `tolerance` of each other and returns
+    one position per group: the mean of its solid strokes, or of all of them if none is solid.
+    """
+    positions = []
+    group = []
+    for candidate in sorted(candidates) + [(float("inf"), False)]:
+        if group and candidate[0] - group[-1][0] > tolerance:
+            solid = [position for position, is_solid in group if is_solid] or [position for position, _ in group]
+            positions.append(sum(solid) / len(solid))
+            group = []
+        group.append(candidate)
+    return positions
+
+
+def _keep_panel_sized(positions, lo, hi, min_size):
+    """Drops positions that would leave a panel narrower than min_size (edges included)."""
+    kept = []
+    for position in sorted(positions):
+        if position - (kept[-1] if kept else lo) >= min_size and hi - position >= min_size:
+            kept.append(position)
+    return kept
+
+
+# --- 3. Fold Detection ---
+def fold_marks(segments, trim, axis):
+    """
+    Fold positions along an axis ('x' for vertical folds, 'y' for horizontal ones), read from
+    the short ticks printed in the slug beyond the trim box. Crop marks, which sit on the trim
+    edges themselves, are left out.
+    """
+    if axis == "x":
+        ticks = [s for s in segments if s.axis == "v" and (s.end <= trim.y0 + 1 or s.start >= trim.y1 - 1)]
+        lo, hi = trim.x0, trim.x1
+    else:
+        ticks = [s for s in segments if s.axis == "h" and (s.end <= trim.x0 + 1 or s.start >= trim.x1 - 1)]
+        lo, hi = trim.y0, trim.y1
+    candidates = [(s.position, s.solid) for s in ticks
+                  if _is_mark(s) and lo + MARK_CLUSTER_TOLERANCE < s.position < hi - MARK_CLUSTER_TOLERANCE]
+    return cluster_positions(candidates)
+
+
+def border_lines(segments, trim, axis, words):
+    """Positions of drawn panel borders: strokes spanning nearly the whole trim that no word crosses."""
+    if axis == "x":
+        span, lo, hi = trim.height, trim.x0, trim.x1
+        crosses = lambda position: any(w[0] < position < w[2] for w in words)
+        lines = [s for s in segments if s.axis == "v"]
+    else:
+        span, lo, hi = trim.width, trim.y0, trim.y1
+        crosses = lambda position: any(w[1] < position < w[3] for w in words)
+        lines = [s for s in segments if s.axis == "h"]
+    candidates = [(s.position, s.solid) for s in lines
+                  if s.end - s.start >= BORDER_MIN_SPAN * span and lo < s.position < hi]
+    return [position for position in cluster_positions(candidates) if not crosses(position)]
+
+
+def coverage_profile(starts, ends, lo, hi, resolution=PROFILE_RESOLUTION):
+    """
+    A projection histogram: how many of the intervals [starts[i], ends[i]) cover each
+    `resolution`-wide bin of [lo, hi). Built from a difference array, so it's one pass in numpy
+    however many words there are.
+    """
+    bins = max(1, int(np.ceil((hi - lo) / resolution)))
+    first = np.clip(np.floor((np.asarray(starts, dtype=float) - lo) / resolution), 0, bins).astype(int)
+    last = np.clip(np.ceil((np.asarray(ends, dtype=float) - lo) / resolution), 0, bins).astype(int)
+    delta = np.zeros(bins + 1, dtype=np.int64)
+    np.add.at(delta, first, 1)
+    np.add.at(delta, last, -1)
+    return np.cumsum(delta[:-1])
+
+
+def whitespace_gutters(profile, lo, min_width=GUTTER_MIN_WIDTH, resolution=PROFILE_RESOLUTION, max_coverage=0):
+    """
+    (start, end) of every run of (nearly) empty bins in a coverage profile, i.e. covered by at most
+    max_coverage intervals, at least min_width wide. Runs touching either end are margins, not
+    gutters, and are left out.
+    """
+    empty = np.concatenate(([0], (profile <= max_coverage).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(empty))
+    starts, ends = edges[0::2], edges[1::2]
+    keep = (starts > 0) & (ends < len(profile)) & ((ends - starts) * resolution >= min_width)
+    return [(float(lo + start * resolution), float(lo + end * resolution)) for start, end in zip(starts[keep], ends[keep])]
+
+
+def gutter_folds(words, trim):
+    """
+    Vertical folds guessed from the whitespace between words, for sheets with no marks or
+    borders: the widest gutters win, as long as every panel stays MIN_PANEL_SIZE wide.
+    """
+    inside = [w for w in words if trim.x0 <= w[0] and w[2] <= trim.x1 and trim.y0 <= w[1] and w[3] <= trim.y1]
+    if not inside:
+        return []
+    profile = coverage_profile([w[0] for w in inside], [w[2] for w in inside], trim.x0, trim.x1)
+    gutters = sorted(whitespace_gutters(profile, trim.x0), key=lambda gutter: gutter[0] - gutter[1])
+    folds = []
+    for start, end in gutters:
+        centre = (start + end) / 2
+        if all(abs(centre - edge) >= MIN_PANEL_SIZE for edge in [trim.x0, trim.x1] + folds):
+            folds.append(centre)
+    return sorted(folds)
+
+
+def _valley_depth(profile):
+    return int(COLUMN_VALLEY_SHARE * profile.max()) if len(profile) else 0
+
+
+def detect_columns(words, coords):
+    """
+    Splits a panel's words into text columns at the whitespace valleys of their x-projection.
+    Returns the columns in the layout JSON's `columns` format, left to right (a single column
+    spanning the panel if there's no split).
+    """
+    x0, y0, x1, y1 = coords
+    if not words:
+        return [{"coords": [x0, y0, x1, y1]}]
+    lefts = np.array([w[0] for w in words], dtype=float)
+    profile = coverage_profile(lefts, [w[2] for w in words], x0, x1)
+    valleys = whitespace_gutters(profile, x0, COLUMN_GAP_MIN_WIDTH, max_coverage=_valley_depth(profile))
+
+    splits = []
+    for start, end in sorted(valleys, key=lambda valley: valley[0] - valley[1]):
+        bounds = sorted([x0, x1, (start + end) / 2] + splits)
+        if np.histogram(lefts, bins=bounds)[0].min() >= MIN_COLUMN_SHARE * len(words):
+            splits.append((start + end) / 2)
+    bounds = [x0] + sorted(splits) + [x1]
+    return [{"coords": [round(left, 2), y0, round(right, 2), y1]} for left, right in zip(bounds, bounds[1:])]
+
+
+def columns_fit(words, columns):
+    """True if every boundary between the columns still falls in a whitespace valley of these words."""
+    x0, x1 = columns[0]["coords"][0], columns[-1]["coords"][2]
+    if len(columns) == 1 or not words:
+        return True
+    profile = coverage_profile([w[0] for w in words], [w[2] for w in words], x0, x1)
+    bins = [int((column["coords"][0] - x0) / PROFILE_RESOLUTION) for column in columns[1:]]
+    return all(profile[min(b, len(profile) - 1)] <= _valley_depth(profile) for b in bins)
+
+
+# --- 4. Panels ---
+def panel_orientation(text_lines, rect):
+    """'landscape' if most of the panel's text runs vertically (a title printed sideways), else 'portrait'."""
+    across = down = 0
+    for bbox, direction, length in text_lines:
+        if rect.x0 <= (bbox[0] + bbox[2]) / 2 < rect.x1 and rect.y0 <= (bbox[1] + bbox[3]) / 2 < rect.y1:
+            if abs(direction[0]) >= abs(direction[1]):
+                across += length
+            else:
+                down += length
+    return "landscape" if down > across else "portrait"
+
+
+def infer_page_panels(page):
+    """
+    Splits one page into panels at its folds. Fold marks are trusted first, then drawn borders,
+    then (for vertical folds only) word gutters. Outer panels run to the page edges, like the
+    hand-made layouts. Returns (panels in reading order, the source used for each axis).
+    """
+    segments = line_segments(page)
+    trim = page_trim_box(page, segments)
+    # One text extraction for both words and line directions; images are left out, as they're never needed.
+    textpage = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+    words = page.get_text("words", textpage=textpage)
+
+    folds, sources = {}, {}
+    for axis, name in (("x", "columns"), ("y", "rows")):
+        lo, hi = (trim.x0, trim.x1) if axis == "x" else (trim.y0, trim.y1)
+        found, source = fold_marks(segments, trim, axis), "fold marks"
+        if not found:
+            found, source = border_lines(segments, trim, axis, words), "panel borders"
+        if not found and axis == "x":
+            found, source = gutter_folds(words, trim), "word gutters"
+        folds[axis] = _keep_panel_sized(found, lo, hi, MIN_PANEL_SIZE)
+        sources[name] = source if folds[axis] else None
+
+    xs = [page.rect.x0] + folds["x"] + [page.rect.x1]
+    ys = [page.rect.y0] + folds["y"] + [page.rect.y1]
+
+    text_lines = [(line["bbox"], line["dir"], sum(len(span["text"]) for span in line["spans"]))
+                  for block in page.get_text("dict", textpage=textpage)["blocks"] for line in block.get("lines", [])]
+    panels = []
+    for y0, y1 in zip(ys, ys[1:]):
+        for x0, x1 in zip(xs, xs[1:]):
+            rect = fitz.Rect(x0, y0, x1, y1)
+            panels.append({"rect": rect, "orientation": panel_orientation(text_lines, rect),
+                           "text": " ".join(w[4] for w in words if x0 <= w[0] < x1 and y0 <= w[1] < y1)})
+    return panels, sources
+
+
+def guess_panel_types(panels):
+    """
+    A first guess at panel_types, to be reviewed: cover sheet (page 0) panels are metadata, as
+    in every hand-made layout; the rest are instructional, English or Spanish by common words.
+    """
+    panel_types = {"metadata": [], "instructional_panels_en": [], "instructional_panels_es": []}
+    for panel_num, panel in panels.items():
+        if panel["page"] == 0:
+            panel_types["metadata"].append(panel_num)
+            continue
+        words = [word.lower().strip(".,;:()") for word in panel["text"].split()]
+        english = sum(word in ENGLISH_WORDS for word in words)
+        spanish = sum(word in SPANISH_WORDS for word in words)
+        panel_types["instructional_panels_es" if spanish > english else "instructional_panels_en"].append(panel_num)
+
+    if not any(PART_NUMBER_PATTERN.search(panels[num]["text"]) for num in panel_types["metadata"]):
+        # No part number on the cover sheet: use whichever panels carry it instead.
+        found = [num for num, panel in panels.items() if PART_NUMBER_PATTERN.search(panel["text"])]
+        if found:
+            for key in ("instructional_panels_en", "instructional_panels_es"):
+                panel_types[key] = [num for num in panel_types[key] if num not in found]
+            panel_types["metadata"] = sorted(set(panel_types["metadata"]) | set(found))
+    return panel_types
+
+
+# --- 5. Layout Inference ---
+def infer_layout(pdf_path):
+    """
+    Builds a complete layout config (panel_layout with page, coords and orientation, plus a
+    guessed panel_types) for a PDF from its printer's marks and text, with no hand-written grid.
+    """
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    panels = {}
+    inferred_from = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            page_panels, sources = infer_page_panels(page)
+            inferred_from.append(sources)
+            for panel in page_panels:
+                panels[len(panels) + 1] = dict(panel, page=page.number)
+
+    panel_layout = {
+        str(panel_num): {"page": panel["page"], "coords": [round(c, 2) for c in panel["rect"]],
+                         "orientation": panel["orientation"]}
+        for panel_num, panel in panels.items()
+    }
+    return {
+        "description": f"Auto-generated layout for {name}",
+        "inferred_from": inferred_from,
+        "panel_layout": panel_layout,
+        "panel_types": guess_panel_types(panels),
+    }
+
+
+def save_layout(layout_config, pdf_path, layout_folder_path=None):
+    """Writes an inferred layout next to the hand-made ones, as layout_autogen_<pdf name>.json, and returns its filename."""
+    if layout_folder_path is None:
+        layout_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), LAYOUT_CONFIG_FOLDER)
+    os.makedirs(layout_folder_path, exist_ok=True)
+    layout_filename = f"layout_autogen_{os.path.splitext(os.path.basename(pdf_path))[0]}.json"
+    with open(os.path.join(layout_folder_path, layout_filename), "w", encoding="utf-8") as f:
+        json.dump(layout_config, f, indent=4)
+    return layout_filename
+
+
+def draw_layout(pdf_path, panel_layout, output_path):
+    """Draws the panels on a copy of the PDF for a visual check, like Layout_config_helper's debug grid."""
+    with fitz.open(pdf_path) as doc:
+        for panel_num, panel_info in panel_layout.items():
+            page = doc[panel_info["page"]]
+            rect = fitz.Rect(panel_info["coords"])
+            page.draw_rect(rect, color=(1, 0, 0), width=1.0)
+            page.insert_text(rect.top_left + (5, 15), f"P{panel_num} ({panel_info['orientation']})", color=(1, 0, 0))
+        doc.save(output_path, garbage=4, deflate=True, clean=True)
+
+
+# --- 6. Main Execution ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Infer an IFU layout config from a PDF's fold marks, borders and text.")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to analyze.")
+    parser.add_argument("--save", action="store_true", help=f"Save each layout to '{LAYOUT_CONFIG_FOLDER}' as layout_autogen_<name>.json.")
+    parser.add_argument("--debug-pdf", action="store_true", help="Also write <name>_layout_debug.pdf with the panels drawn on.")
+    args = parser.parse_args()
+
+    for pdf_path in args.pdfs:
+        layout_config = infer_layout(pdf_path)
+        print(f"\n--- {os.path.basename(pdf_path)}: {len(layout_config['panel_layout'])} panels ---")
+        for page_num, sources in enumerate(layout_config["inferred_from"]):
+            coords = [panel["coords"] for panel in layout_config["panel_layout"].values() if panel["page"] == page_num]
+            print(f"  Page {page_num + 1}: {len(coords)} panels "
+                  f"(columns from {sources['columns'] or 'none'}, rows from {sources['rows'] or 'none'})")
+        print(f"  Panel types (guessed): {layout_config['panel_types']}")
+
+        if args.save:
+            print(f"  -> Saved to '{save_layout(layout_config, pdf_path)}'")
+        if args.debug_pdf:
+            debug_path = os.path.splitext(pdf_path)[0] + "_layout_debug.pdf"
+            draw_layout(pdf_path, layout_config["panel_layout"], debug_path)
+            print(f"  -> Debug PDF written to '{debug_path}'")
@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import DB_importer_script_V2 as db_setup
+from sentence_index import index_panel_sentences
+from draft_store import insert_draft_panels
+
+# --- 1. Configuration ---
+# Roughly the size of today's corpus; --scale multiplies it.
+BASE_DOCUMENT_COUNT = 26
+DEFAULT_OUTPUT_FILE = "load_test_database.db"
+DEFAULT_SERVER_URL = "http://127.0.0.1:5001"
+# Panel counts of the real layouts in LAYOUT_CONFIGS.
+PANEL_LAYOUTS = [8, 10, 12, 14, 18, 22, 26]
+# Share of documents that also have a Spanish version.
+SPANISH_SHARE = 0.6
+# Per-panel word counts, as (min, max), by panel type.
+PANEL_WORD_RANGES = {"metadata": (8, 25), "instructional": (60, 220), "regulatory": (90, 300)}
+
+# Sentences that repeat across many IFUs, as they do in the real corpus.
+BOILERPLATE_SENTENCES = [
+    "For in vitro diagnostic use only.",
+    "Single use only. Do not reuse.",
+    "Store at room temperature between 15 °C and 30 °C.",
+    "Do not use if the package is damaged or opened.",
+    "Read the instructions for use carefully before collecting the specimen.",
+    "Label each tube with the patient identification before collection.",
+    "Ship the specimen to the laboratory on the day of collection.",
+    "Keep the kit out of direct sunlight.",
+    "Wash your hands before and after handling the specimen.",
+    "Dispose of used materials in accordance with local regulations.",
+    "Refer to the laboratory requisition form for test ordering information.",
+    "Do not freeze the specimen.",
+    "Place the sealed bag in the shipping box provided.",
+    "Contact customer service if any component is missing.",
+]
+VOCABULARY = (
+    "specimen tube collection patient label bag box swab blood urine serum plasma sample kit laboratory "
+    "transport shipping seal cap vial tissue container requisition form barcode date time temperature "
+    "gently invert mix fill line absorbent pad biohazard courier pickup stability hours days refrigerate "
+    "centrifuge aliquot pipette needle lancet saliva funnel cup wipe gloves record instructions"
+).split()
+SAMPLE_TYPES = [["Blood", "Whole Blood"], ["Blood", "Serum"], ["Blood", "Plasma"], ["Urine"], ["Saliva"], ["Tissue", "FFPE"], ["Swab", "Nasal"]]
+MARKETS = ["US", "EU", "CA", "LATAM", "APAC"]
+CONSUMABLES = ["Lavender Top Tube", "Gold Top Tube", "Urine Cup", "Specimen Bag", "Absorbent Pad", "Transport Box", "Saliva Funnel", "Cold Pack"]
+STABILITY_TYPES = ["Ambient", "Refrigerated", "Frozen"]
+
+# Relative frequency of each operation in the mixed workload.
+WORKLOAD_MIX = {
+    "browse_list": 25,
+    "browse_document": 30,
+    "part_number_lookup": 10,
+    "search": 15,
+    "compare": 10,
+    "submit_draft": 5,
+    "submit_request": 5,
+}
+HTTP_TIMEOUT_SECONDS = 60
+
+
+# --- 2. Synthetic Corpus ---
+def _filler_sentence(rng):
+    words = rng.choices(VOCABULARY, k=rng.randint(6, 18))
+    return " ".join(words).capitalize() + "."
+
+
+def _panel_text(rng, panel_type, part_number, version):
+    if panel_type == "metadata":
+        return f"{part_number}-{version} " + " ".join(rng.choices(VOCABULARY, k=rng.randint(*PANEL_WORD_RANGES["metadata"])))
+    low, high = PANEL_WORD_RANGES[panel_type]
+    target_words = rng.randint(low, high)
+    sentences, word_count = [], 0
+    while word_count < target_words:
+        # About a third of every panel is shared boilerplate.
+        sentence = rng.choice(BOILERPLATE_SENTENCES) if rng.random() < 0.35 else _filler_sentence(rng)
+        sentences.append(sentence)
+        word_count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def _panel_type(panel_number, panel_count):
+    if panel_number <= 2:
+        return "metadata"
+    if panel_number > panel_count - 2:
+        return "regulatory"
+    return "instructional"
+
+
+def generate_corpus(db_file, document_count, seed=0, overwrite=False):
+    """
+    Builds a synthetic database with the real schema (from initialize_database): document_count
+    IFUs with metadata, panels and sentence index, plus open requests and drafts. The corpus is
+    always built in a fresh file: an existing db_file is refused, or deleted first if overwrite.
+    """
+    if os.path.exists(db_file):
+        if not overwrite:
+            raise FileExistsError(f"'{db_file}' already exists; pass --overwrite to replace it.")
+        for path in (db_file, db_file + '-wal', db_file + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    rng = random.Random(seed)
+    db_setup.DATABASE_FILE = db_file
+    db_setup.initialize_database()
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    started = datetime.now()
+    panel_total = 0
+    for i in range(document_count):
+        part_number, version = f"QR-IFU-{100000 + i}", f"R{rng.randint(1, 9)}"
+        panel_count = rng.choice(PANEL_LAYOUTS)
+        metadata = (
+            json.dumps(rng.choice(SAMPLE_TYPES)), json.dumps(rng.sample(MARKETS, rng.randint(1, 2))),
+            f"D{rng.randint(1000, 9999)}", json.dumps([f"KIT-{rng.randint(100, 999)}" for _ in range(rng.randint(1, 3))]),
+            json.dumps(rng.sample(CONSUMABLES, rng.randint(1, 4))), rng.choice(STABILITY_TYPES),
+        )
+        languages = ["english", "spanish"] if rng.random() < SPANISH_SHARE else ["english"]
+        for language in languages:
+            cursor.execute('''
+                INSERT INTO ifu_documents (part_number, document_version, language, source_filename, created_at,
+                                                     sample_type, market, dispatch_code, kit_code, consumables, stability_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (part_number, version, language, f"{part_number}_{version}.pdf", started) + metadata)
+            document_id = cursor.lastrowid
+            for panel_number in range(1, panel_count + 1):
+                panel_type = _panel_type(panel_number, panel_count)
+                text = _panel_text(rng, panel_type, part_number, version)
+                cursor.execute('''
+                    INSERT INTO content_panels (document_id, panel_number, panel_type, content_text, content_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (document_id, panel_number, panel_type, text, db_setup.generate_hash(text)))
+                index_panel_sentences(cursor, document_id, cursor.lastrowid, panel_number, language, text)
+                panel_total += 1
+
+    request_ids = []
+    for i in range(max(1, document_count // 2)):
+        cursor.execute('''
+            INSERT INTO ifu_requests (request_type, status, part_number_to_update, sample_type, market,
+                                      created_by, created_at, jira_key, request_summary)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ("New IFU", "Pending Content Review", f"QR-IFU-{100000 + rng.randrange(document_count)}",
+              json.dumps(rng.choice(SAMPLE_TYPES)), rng.choice(MARKETS), "Cesar (NPI)",
+              started - timedelta(hours=i), f"NPI-{1000 + i}", f"Synthetic request {i}"))
+        request_ids.append(cursor.lastrowid)
+    for i in range(max(1, document_count // 4)):
+        cursor.execute('''
+            INSERT INTO content_drafts (request_id, status, created_by, created_at,
+                                        jira_key, request_summary, market, sample_type, consumables)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (request_ids[i], "Pending Regulatory Review", "Cintia (Content Team)", started - timedelta(hours=i),
+              f"NPI-{1000 + i}", f"Synthetic request {i}", rng.choice(MARKETS),
+              json.dumps(rng.choice(SAMPLE_TYPES)), json.dumps(rng.sample(CONSUMABLES, 2))))
+        insert_draft_panels(cursor, cursor.lastrowid, [
+            {"panel_type": "drafted_content", "content_text": _panel_text(rng, "instructional", "", "")} for _ in range(4)
+        ])
+
+    conn.commit()
+    conn.close()
+    print(f"Generated {document_count} IFUs ({panel_total} panels) in '{db_file}' "
+          f"in {(datetime.now() - started).total_seconds():.1f}s.")
+
+
+# --- 3. Workload ---
+class WorkloadClient:
+    """Issues the API calls a reviewer's browser makes, picking targets from the live corpus."""
+
+    def __init__(self, base_url, seed):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed)
+        self.ifus = []
+        self.panel_samples = []
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Accept-Encoding', 'gzip')
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT_SECONDS) as response:
+            return response.status, response.read()
+
+    def prepare(self):
+        """Loads the document list and a sample of panels to use as compare/search input."""
+        req = urllib.request.Request(self.base_url + '/api/ifus')
+        with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT_SECONDS) as response:
+            self.ifus = json.loads(response.read())
+        if not self.ifus:
+            raise RuntimeError("The server has no IFUs to browse; generate a corpus first.")
+        for ifu in self.rng.sample(self.ifus, min(10, len(self.ifus))):
+            with urllib.request.urlopen(f"{self.base_url}/api/ifu/{ifu['id']}", timeout=HTTP_TIMEOUT_SECONDS) as response:
+                self.panel_samples += [p for p in json.loads(response.read()) if p['panel_type'] != 'metadata']
+
+    def run_operation(self, name):
+        ifu = self.rng.choice(self.ifus)
+        if name == "browse_list":
+            return self.request('GET', '/api/ifus')
+        if name == "browse_document":
+            return self.request('GET', f"/api/ifu/{ifu['id']}")
+        if name == "part_number_lookup":
+            return self.request('GET', f"/api/ifu-by-part-number/{ifu['part_number']}/{ifu['document_version']}")
+        if name == "search":
+            return self.request('POST', '/api/search', {"searchTerm": self.rng.choice(VOCABULARY)})
+        if name == "compare":
+            panel = self.rng.choice(self.panel_samples)
+            return self.request('POST', '/api/compare', {"text": panel['content_text'], "panel_type": panel['panel_type']})
+        if name == "submit_draft":
+            return self.request('POST', '/api/drafts', {
+                "request_id": 1, "jira_key": "LOAD-1", "request_summary": "Load test draft",
+                "content_panels": [{"panel_type": "drafted_content", "content_text": _filler_sentence(self.rng)}],
+            })
+        if name == "submit_request":
+            return self.request('POST', '/api/requests', {
+                "request_type": "Update", "part_number_to_update": ifu['part_number'],
+                "created_by": "Load Test", "request_summary": "Load test request",
+            })
+        raise ValueError(f"Unknown operation '{name}'")
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_workload(base_url, duration, concurrency, seed=0):
+    """Runs the mixed workload for duration seconds with concurrency clients and prints a latency report."""
+    client = WorkloadClient(base_url, seed)
+    client.prepare()
+    operations, weights = zip(*WORKLOAD_MIX.items())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_seed):
+        worker_client = WorkloadClient(base_url, worker_seed)
+        worker_client.ifus, worker_client.panel_samples = client.ifus, client.panel_samples
+        while time.perf_counter() < deadline:
+            name = worker_client.rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                worker_client.run_operation(name)
+                failed = False
+            except (urllib.error.URLError, OSError) as e:
+                failed = True
+                print(f"  -> {name} failed: {e}")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if failed:
+                    errors[name] += 1
+
+    print(f"Running mixed workload against {base_url}: {concurrency} clients for {duration}s...")
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed + i + 1,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+
+    print(f"\n{'operation':<20}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    total = 0
+    for name in operations:
+        samples = sorted(latencies.get(name, []))
+        total += len(samples)
+        print(f"{name:<20}{len(samples):>10}{errors.get(name, 0):>8}{len(samples) / wall_time:>9.1f}"
+              f"{_percentile(samples, 50) * 1000:>10.1f}{_percentile(samples, 95) * 1000:>10.1f}{_percentile(samples, 99) * 1000:>10.1f}")
+    every_sample = sorted(s for samples in latencies.values() for s in samples)
+    print(f"{'TOTAL':<20}{total:>10}{sum(errors.values()):>8}{total / wall_time:>9.1f}"
+          f"{_percentile(every_sample, 50) * 1000:>10.1f}{_percentile(every_sample, 95) * 1000:>10.1f}{_percentile(every_sample, 99) * 1000:>10.1f}")
+
+
+# --- 4. Execution Block ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test harness for api_server.py.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    generate = subcommands.add_parser("generate", help="Build a synthetic IFU database at a chosen scale.")
+    generate.add_argument("--scale", type=float, default=10, help=f"Multiple of today's corpus ({BASE_DOCUMENT_COUNT} IFUs).")
+    generate.add_argument("--documents", type=int, help="Exact number of IFUs (overrides --scale).")
+    generate.add_argument("--output", default=DEFAULT_OUTPUT_FILE)
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--overwrite", action="store_true", help="Replace --output if it already exists.")
+
+    run = subcommands.add_parser("run", help="Drive a mixed workload against a running server.")
+    run.add_argument("--url", default=DEFAULT_SERVER_URL)
+    run.add_argument("--duration", type=float, default=30, help="Seconds to run for.")
+    run.add_argument("--concurrency", type=int, default=16, help="Number of simulated reviewers.")
+    run.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        try:
+            generate_corpus(args.output, args.documents or max(1, int(BASE_DOCUMENT_COUNT * args.scale)), args.seed,
+                            overwrite=args.overwrite)
+        except FileExistsError as e:
+            parser.error(str(e))
+    else:
+        run_workload(args.url, args.duration, args.concurrency, args.seed)
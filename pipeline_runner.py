@@ -0,0 +1,263 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from spreadsheet_cache import file_sha256
+
+# --- 1. Configuration ---
+DATABASE_FILE = "ifu_database.db"
+DEFAULT_WORKERS = 3
+
+# The ingestion scripts as a DAG. Each stage runs its script (from the project folder, as
+# when run by hand) and is skipped when the script, its input files and its upstream stages
+# are unchanged since its last successful run and its outputs still exist.
+#   inputs:   glob patterns of the files the stage reads. "required" ones must exist to run.
+#   after:    stages that must finish first (the stages writing ifu_database.db run in turn).
+PIPELINE_STAGES = {
+    "extract_pdfs": {
+        "script": "PDF_extractor.py",
+        "inputs": ["REPOSITORY FOR PROCESSING/*.pdf", "REPOSITORY FOR PROCESSING/*.PDF", "LAYOUT_CONFIGS/*.json", "layout_inference.py"],
+        "outputs": ["batch_extraction_output.json"],
+        "after": [],
+    },
+    "load_panels": {
+        "script": "DB_importer_script_V2.py",
+        "inputs": ["batch_extraction_output.json", "LAYOUT_CONFIGS/*.json", "sentence_index.py", "draft_store.py"],
+        "required": ["batch_extraction_output.json"],
+        "after": ["extract_pdfs"],
+    },
+    "smart_bom": {
+        "script": "import_bom_data.py",
+        "inputs": ["Bill of Materials-Rev_130.xlsx"],
+        "required": ["Bill of Materials-Rev_130.xlsx"],
+        "after": ["load_panels"],
+    },
+    # Writes the same columns as smart_bom, so it runs after it (and again whenever it does).
+    "transposed_bom": {
+        "script": "BOM importer.py",
+        "inputs": ["BOM extraction mock-up.xlsx"],
+        "required": ["BOM extraction mock-up.xlsx"],
+        "after": ["smart_bom"],
+    },
+    # Matches on the kit codes the BOM stages write.
+    "stability": {
+        "script": "Stability Data Import.py",
+        "inputs": ["Stability Data Import.xlsx"],
+        "required": ["Stability Data Import.xlsx"],
+        "after": ["transposed_bom"],
+    },
+    # Independent of the rest: copies the IFU workbook into GlueApp.db.
+    "workbook": {
+        "script": "SQL_IFUQueryBase.py",
+        "inputs": ["IFU_Workbook_V2_Nov24.xlsx"],
+        "required": ["IFU_Workbook_V2_Nov24.xlsx"],
+        "outputs": ["GlueApp.db"],
+        "after": [],
+    },
+}
+
+# Stage statuses. Only 'failed' and 'blocked' stop the stages after them.
+RAN, SKIPPED, NO_INPUT, FAILED, BLOCKED = "ran", "skipped", "no input", "failed", "blocked"
+
+
+# --- 2. Run History ---
+def initialize_pipeline_history(cursor):
+    """Creates the tables recording each pipeline run and what every stage did in it."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT, started_at TIMESTAMP NOT NULL, finished_at TIMESTAMP,
+            status TEXT, forced INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_stage_runs (
+            run_id INTEGER NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, fingerprint TEXT,
+            started_at TIMESTAMP, duration_seconds REAL, error TEXT,
+            PRIMARY KEY (run_id, stage),
+            FOREIGN KEY (run_id) REFERENCES pipeline_runs (run_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pipeline_stage_runs_stage ON pipeline_stage_runs (stage, run_id)')
+
+
+def last_good_fingerprint(conn, stage):
+    """The fingerprint of the stage's inputs the last time it ran (or was skipped) successfully."""
+    row = conn.execute('''
+        SELECT fingerprint FROM pipeline_stage_runs
+        WHERE stage = ? AND status IN (?, ?)
+        ORDER BY run_id DESC LIMIT 1
+    ''', (stage, RAN, SKIPPED)).fetchone()
+    return row[0] if row else None
+
+
+def print_history(conn, limit=10):
+    runs = conn.execute('SELECT * FROM pipeline_runs ORDER BY run_id DESC LIMIT ?', (limit,)).fetchall()
+    if not runs:
+        print("No pipeline runs recorded yet.")
+    for run_id, started_at, finished_at, status, forced in runs:
+        print(f"\nRun #{run_id} {started_at} -> {finished_at or '?'}: {status or 'unfinished'}{' (forced)' if forced else ''}")
+        for stage, stage_status, duration, error in conn.execute('''
+            SELECT stage, status, duration_seconds, error FROM pipeline_stage_runs WHERE run_id = ? ORDER BY started_at
+        ''', (run_id,)):
+            timing = f" in {duration:.1f}s" if duration is not None else ""
+            print(f"  {stage:<16} {stage_status}{timing}{f' - {error}' if error else ''}")
+
+
+# --- 3. Fingerprints ---
+def expand_inputs(project_dir, patterns):
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(project_dir, pattern)))
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def stage_fingerprint(project_dir, stage, upstream_fingerprints):
+    """Hashes the stage's script, the contents of its input files and its upstream stages' fingerprints."""
+    config = PIPELINE_STAGES[stage]
+    files = [os.path.join(project_dir, config["script"])] + expand_inputs(project_dir, config["inputs"])
+    parts = {
+        "files": {os.path.relpath(path, project_dir): file_sha256(path) for path in files},
+        "upstream": {name: upstream_fingerprints.get(name) for name in config["after"]},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def missing_required_inputs(project_dir, stage):
+    return [pattern for pattern in PIPELINE_STAGES[stage].get("required", [])
+            if not expand_inputs(project_dir, [pattern])]
+
+
+# --- 4. Execution ---
+def run_stage_script(project_dir, stage):
+    """
+    Runs a stage's script in its own process. Returns (succeeded, captured output). The scripts
+    exit non-zero on a fatal error (e.g. a missing input file), which fails the stage.
+    """
+    result = subprocess.run([sys.executable, PIPELINE_STAGES[stage]["script"]], cwd=project_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
+    return result.returncode == 0, result.stdout
+
+
+def upstream_closure(stages):
+    """The given stages plus everything they depend on."""
+    selected, pending = set(), list(stages)
+    while pending:
+        stage = pending.pop()
+        if stage not in selected:
+            selected.add(stage)
+            pending.extend(PIPELINE_STAGES[stage]["after"])
+    return selected
+
+
+def run_pipeline(project_dir=None, force=False, only=None, workers=DEFAULT_WORKERS, verbose=False):
+    """
+    Runs the ingestion DAG. Stages whose dependencies are done start straight away, up to
+    `workers` at a time, so independent branches (PDF extraction, the workbook copy) overlap.
+    Returns {stage: status}.
+    """
+    project_dir = project_dir or os.path.dirname(os.path.abspath(__file__))
+    selected = upstream_closure(only) if only else set(PIPELINE_STAGES)
+
+    conn = sqlite3.connect(os.path.join(project_dir, DATABASE_FILE), timeout=30)
+    cursor = conn.cursor()
+    initialize_pipeline_history(cursor)
+    cursor.execute('INSERT INTO pipeline_runs (started_at, forced) VALUES (?, ?)', (datetime.now(), int(force)))
+    run_id = cursor.lastrowid
+    conn.commit()
+    print(f"--- Pipeline run #{run_id}: {len(selected)} stage(s) ---")
+
+    statuses, fingerprints, started = {}, {}, {}
+    running = {}
+    # Written once every stage is done: a loader holds the database's write lock for its whole run.
+    stage_rows = []
+
+    def record(stage, status, fingerprint=None, duration=None, error=None):
+        statuses[stage] = status
+        fingerprints[stage] = fingerprint
+        stage_rows.append((run_id, stage, status, fingerprint, started.get(stage, datetime.now()), duration, error))
+        timing = f" in {duration:.1f}s" if duration is not None else ""
+        print(f"  [{stage}] {status}{timing}{f': {error}' if error else ''}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while len(statuses) < len(selected):
+            for stage in PIPELINE_STAGES:
+                if stage not in selected or stage in statuses or stage in running:
+                    continue
+                upstream = [name for name in PIPELINE_STAGES[stage]["after"] if name in selected]
+                if any(statuses.get(name) in (FAILED, BLOCKED) for name in upstream):
+                    record(stage, BLOCKED, error="upstream stage failed")
+                    continue
+                if any(name not in statuses for name in upstream):
+                    continue
+
+                started[stage] = datetime.now()
+                missing = missing_required_inputs(project_dir, stage)
+                if missing:
+                    record(stage, NO_INPUT, error=f"not found: {', '.join(missing)}")
+                    continue
+                fingerprint = stage_fingerprint(project_dir, stage, fingerprints)
+                outputs_exist = all(os.path.exists(os.path.join(project_dir, path)) for path in PIPELINE_STAGES[stage].get("outputs", []))
+                if not force and outputs_exist and fingerprint == last_good_fingerprint(conn, stage):
+                    record(stage, SKIPPED, fingerprint)
+                    continue
+                print(f"  [{stage}] running {PIPELINE_STAGES[stage]['script']}...")
+                running[stage] = (pool.submit(run_stage_script, project_dir, stage), fingerprint, time.perf_counter())
+
+            if not running:
+                continue
+            done, _ = wait([future for future, _, _ in running.values()], return_when=FIRST_COMPLETED)
+            for stage in [name for name, (future, _, _) in running.items() if future in done]:
+                future, fingerprint, start = running.pop(stage)
+                duration = time.perf_counter() - start
+                try:
+                    succeeded, output = future.result()
+                except OSError as e:
+                    succeeded, output = False, str(e)
+                if verbose or not succeeded:
+                    print(f"\n--- {stage} output ---\n{output.rstrip()}\n--- end of {stage} output ---")
+                if succeeded:
+                    record(stage, RAN, fingerprint, duration)
+                else:
+                    last_line = output.strip().splitlines()[-1] if output.strip() else "no output"
+                    record(stage, FAILED, fingerprint, duration, error=last_line[:500])
+
+    run_status = "failed" if any(status in (FAILED, BLOCKED) for status in statuses.values()) else "succeeded"
+    conn.executemany('''
+        INSERT INTO pipeline_stage_runs (run_id, stage, status, fingerprint, started_at, duration_seconds, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', stage_rows)
+    conn.execute('UPDATE pipeline_runs SET finished_at = ?, status = ? WHERE run_id = ?', (datetime.now(), run_status, run_id))
+    conn.commit()
+    conn.close()
+
+    counts = {status: sum(1 for value in statuses.values() if value == status) for status in (RAN, SKIPPED, NO_INPUT, FAILED, BLOCKED)}
+    print(f"\n--- Pipeline run #{run_id} {run_status}: " + ", ".join(f"{count} {status}" for status, count in counts.items() if count) + " ---")
+    return statuses
+
+
+# --- 5. Execution Block ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bring the IFU database up to date, re-running only the ingestion stages whose inputs changed.")
+    parser.add_argument("--force", action="store_true", help="Run every stage even if its inputs are unchanged.")
+    parser.add_argument("--only", nargs="+", choices=list(PIPELINE_STAGES), help="Run these stages (and the stages they depend on).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="How many independent stages may run at once.")
+    parser.add_argument("--verbose", action="store_true", help="Print each stage's output, not just that of failed stages.")
+    parser.add_argument("--history", action="store_true", help="Show recent runs instead of running.")
+    args = parser.parse_args()
+
+    if args.history:
+        history_conn = sqlite3.connect(os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_FILE))
+        initialize_pipeline_history(history_conn.cursor())
+        print_history(history_conn)
+        history_conn.close()
+    else:
+        results = run_pipeline(force=args.force, only=args.only, workers=args.workers, verbose=args.verbose)
+        sys.exit(1 if any(status in (FAILED, BLOCKED) for status in results.values()) else 0)
@@ -0,0 +1,103 @@
+import sqlite3
+import json
+import gzip
+import threading
+from collections import defaultdict
+
+from api_responses import dumps, GZIP_LEVEL
+
+
+# --- 1. Shared Helpers ---
+def build_part_number_summary(records):
+    """
+    Merges every ifu_documents row for one part number and version into a single
+    record, with the kit codes, consumables and sample types of all rows combined.
+    """
+    kit_codes, consumables, sample_types = set(), set(), set()
+    for record in records:
+        if record['kit_code'] and record['kit_code'] != '[]': kit_codes.update(json.loads(record['kit_code']))
+        if record['consumables'] and record['consumables'] != '[]': consumables.update(json.loads(record['consumables']))
+        if record['sample_type'] and record['sample_type'] != '[]': sample_types.update(json.loads(record['sample_type']))
+
+    response_data = dict(records[0])
+    response_data['kit_codes'] = sorted(list(kit_codes))
+    response_data['consumables'] = sorted(list(consumables))
+    response_data['sample_types'] = sorted(list(sample_types))
+    return response_data
+
+
+# --- 2. Snapshot ---
+class CorpusSnapshot:
+    """
+    An immutable, pre-encoded copy of ifu_documents and content_panels. Each response
+    body is encoded once at build time; gzipped copies are made on first request.
+    """
+
+    def __init__(self, generation, bodies):
+        self.generation = generation
+        self._bodies = bodies
+        self._gzipped = {}
+
+    def body(self, key):
+        """Returns the encoded JSON body for a key, or None if there is no such entry."""
+        return self._bodies.get(key)
+
+    def gzipped_body(self, key):
+        """Returns the gzipped JSON body for a key, compressing it on first use."""
+        gzipped = self._gzipped.get(key)
+        if gzipped is None and key in self._bodies:
+            gzipped = self._gzipped[key] = gzip.compress(self._bodies[key], compresslevel=GZIP_LEVEL)
+        return gzipped
+
+
+# --- 3. Read Model ---
+class CorpusReadModel:
+    """
+    Serves the IFU list, per-document panels and part-number lookups from memory.
+    The snapshot is rebuilt (and swapped in atomically) whenever the DataVersionWatcher
+    reports that a loader or importer has written to the database.
+    """
+
+    def __init__(self, db_file, watcher):
+        self.db_file = db_file
+        self.watcher = watcher
+        self._snapshot = None
+        self._build_lock = threading.Lock()
+
+    def snapshot(self):
+        """Returns a snapshot that is current as of this call."""
+        generation = self.watcher.check()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.generation == generation:
+            return snapshot
+        with self._build_lock:
+            # Another request may have rebuilt it while we waited for the lock.
+            if self._snapshot is None or self._snapshot.generation != generation:
+                self._snapshot = self._build(generation)
+            return self._snapshot
+
+    def _build(self, generation):
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            ifus = conn.execute('SELECT DISTINCT id, part_number, document_version, language FROM ifu_documents ORDER BY part_number, document_version').fetchall()
+            bodies = {('ifus',): dumps([dict(row) for row in ifus])}
+
+            panels_by_document = defaultdict(list)
+            for row in conn.execute('SELECT * FROM content_panels ORDER BY document_id, panel_number'):
+                panels_by_document[row['document_id']].append(dict(row))
+            for document_id, panels in panels_by_document.items():
+                bodies[('ifu', document_id)] = dumps(panels)
+
+            records_by_part = defaultdict(list)
+            for row in conn.execute('SELECT * FROM ifu_documents ORDER BY id'):
+                records_by_part[(row['part_number'], row['document_version'])].append(row)
+            for (part_number, doc_version), records in records_by_part.items():
+                try:
+                    bodies[('part', part_number, doc_version)] = dumps(build_part_number_summary(records))
+                except ValueError:
+                    pass  # Malformed JSON metadata: leave it to the SQL path, which reports the error.
+        finally:
+            conn.close()
+        print(f"Read model rebuilt: {len(ifus)} documents, {len(panels_by_document)} with panels.")
+        return CorpusSnapshot(generation, bodies)
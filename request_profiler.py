@@ -0,0 +1,112 @@
+import cProfile
+import pstats
+import io
+import os
+import re
+import json
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+# --- 1. Configuration ---
+PROFILE_OUTPUT_FOLDER = os.environ.get('GLUE_PROFILE_DIR', 'profiles')
+# A request is profiled if it carries this header, or this query-string flag, set to 1/true.
+PROFILE_HEADER = 'HTTP_X_GLUE_PROFILE'
+PROFILE_QUERY_FLAG = '_profile'
+# Request bodies are saved alongside the profile, up to this size.
+MAX_SAVED_BODY_BYTES = 64 * 1024
+# Number of functions listed in the human-readable summary.
+SUMMARY_FUNCTION_COUNT = 30
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that runs cProfile over a single request when asked to, covering the
+    view and the rendering of its response body. Each profile is saved as a .prof file
+    (for snakeviz / pstats) plus a .json sidecar with the route, parameters and timings.
+    Streamed responses (Server-Sent Events, row streams) are passed through unprofiled.
+
+    Only install it when profiling is switched on: requests that don't ask for a
+    profile still pay for the flag check.
+    """
+
+    def __init__(self, wsgi_app, output_folder=PROFILE_OUTPUT_FOLDER):
+        self.wsgi_app = wsgi_app
+        self.output_folder = output_folder
+
+    def _wants_profile(self, environ):
+        if environ.get(PROFILE_HEADER, '').lower() in ('1', 'true'):
+            return True
+        flag = parse_qs(environ.get('QUERY_STRING', '')).get(PROFILE_QUERY_FLAG, [''])[0]
+        return flag.lower() in ('1', 'true')
+
+    def __call__(self, environ, start_response):
+        if not self._wants_profile(environ):
+            return self.wsgi_app(environ, start_response)
+
+        # Read the body up front so it can be saved with the profile, then hand the app a fresh copy.
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        body = environ['wsgi.input'].read(content_length) if content_length else b''
+        environ['wsgi.input'] = io.BytesIO(body)
+
+        statuses, streamed = [], []
+
+        def capture_status(status, headers, exc_info=None):
+            statuses.append(status)
+            header_values = {name.lower(): value for name, value in headers}
+            streamed.append(header_values.get('content-type', '').startswith('text/event-stream')
+                            or 'content-length' not in header_values)
+            return start_response(status, headers, exc_info)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        passed_through = False
+        profiler.enable()
+        try:
+            iterable = self.wsgi_app(environ, capture_status)
+            if streamed and streamed[-1]:
+                # Buffering the body to profile it would hold the whole stream in memory,
+                # and an event stream would never finish, so it is handed on untouched.
+                passed_through = True
+                return iterable
+            try:
+                chunks = list(iterable)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            profiler.disable()
+            if passed_through:
+                print(f"Not profiling {environ.get('REQUEST_METHOD', 'GET')} {environ.get('PATH_INFO', '/')}: the response is streamed.")
+            else:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._save(profiler, environ, body, statuses[-1] if statuses else None, elapsed_ms)
+        return chunks
+
+    def _save(self, profiler, environ, body, status, elapsed_ms):
+        os.makedirs(self.output_folder, exist_ok=True)
+        method, path = environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', '/')
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'
+        base_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{method}_{slug}"
+        profile_path = os.path.join(self.output_folder, base_name + '.prof')
+        profiler.dump_stats(profile_path)
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_FUNCTION_COUNT)
+        details = {
+            "method": method,
+            "path": path,
+            "query_string": environ.get('QUERY_STRING', ''),
+            "body": body[:MAX_SAVED_BODY_BYTES].decode('utf-8', errors='replace'),
+            "body_truncated": len(body) > MAX_SAVED_BODY_BYTES,
+            "status": status,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "profile_file": os.path.basename(profile_path),
+            "top_functions": summary.getvalue(),
+        }
+        with open(os.path.join(self.output_folder, base_name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(details, f, indent=2, ensure_ascii=False)
+        print(f"Saved request profile for {method} {path} ({elapsed_ms:.1f} ms) to '{profile_path}'")
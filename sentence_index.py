@@ -0,0 +1,109 @@
+import sqlite3
+
+from content_clusters import (
+    normalize_text, split_sentences, sentence_hash, minhash_signature, estimate_similarity,
+    signature_from_blob, find_similar_hashes
+)
+
+# --- 1. Configuration ---
+DATABASE_FILE = "ifu_database.db"
+
+
+# --- 2. Database Setup ---
+def initialize_sentence_index(cursor):
+    """Creates the inverted sentence index (sentence hash -> document, panel, language)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sentence_index (
+            sentence_hash TEXT NOT NULL, document_id INTEGER NOT NULL, panel_id INTEGER NOT NULL,
+            panel_number INTEGER NOT NULL, language TEXT NOT NULL, position INTEGER NOT NULL, sentence_text TEXT,
+            FOREIGN KEY (document_id) REFERENCES ifu_documents (id),
+            FOREIGN KEY (panel_id) REFERENCES content_panels (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sentence_index_hash ON sentence_index (sentence_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sentence_index_document ON sentence_index (document_id)')
+
+
+# --- 3. Loader Hooks ---
+def clear_document_sentences(cursor, document_id):
+    """Removes the indexed sentences of a document, ahead of its panels being reloaded."""
+    cursor.execute('DELETE FROM sentence_index WHERE document_id = ?', (document_id,))
+
+
+def index_panel_sentences(cursor, document_id, panel_id, panel_number, language, text):
+    """Splits a panel's text into normalized sentences and adds them to the index."""
+    cursor.executemany('''
+        INSERT INTO sentence_index (sentence_hash, document_id, panel_id, panel_number, language, position, sentence_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (sentence_hash(normalized), document_id, panel_id, panel_number, language, position, raw)
+        for position, (raw, normalized) in enumerate(split_sentences(text))
+    ])
+
+
+def rebuild_sentence_index(conn):
+    """Rebuilds the whole index from content_panels (for databases loaded before the index existed)."""
+    cursor = conn.cursor()
+    initialize_sentence_index(cursor)
+    cursor.execute('DELETE FROM sentence_index')
+    panels = cursor.execute('''
+        SELECT p.id, p.document_id, p.panel_number, d.language, p.content_text
+        FROM content_panels p JOIN ifu_documents d ON d.id = p.document_id
+    ''').fetchall()
+    for panel_id, document_id, panel_number, language, text in panels:
+        index_panel_sentences(cursor, document_id, panel_id, panel_number, language, text)
+    conn.commit()
+    return len(panels)
+
+
+# --- 4. Lookups ---
+def find_sentence_usages(conn, sentence, fuzzy=False):
+    """
+    Returns every panel that uses a sentence. With fuzzy=True, near-identical
+    variants (from the sentence clusters and LSH buckets) are included too.
+    """
+    normalized = normalize_text(sentence).rstrip('.!?;: ')
+    target_hash = sentence_hash(normalized)
+    similarity_of = {target_hash: 1.0}
+
+    if fuzzy:
+        signature = minhash_signature(normalized, "sentence")
+        try:
+            cluster = conn.execute("SELECT cluster_id FROM content_cluster_members WHERE level = 'sentence' AND content_hash = ?",
+                                   (target_hash,)).fetchone()
+            if cluster:
+                for member_hash, blob in conn.execute("SELECT content_hash, signature FROM content_cluster_members WHERE level = 'sentence' AND cluster_id = ?",
+                                                      (cluster[0],)):
+                    similarity_of.setdefault(member_hash, round(estimate_similarity(signature, signature_from_blob(blob)), 4))
+            for match_hash, similarity in find_similar_hashes(conn, "sentence", signature).items():
+                similarity_of.setdefault(match_hash, round(similarity, 4))
+        except sqlite3.OperationalError:
+            pass  # Clusters have not been built yet, so only exact matches are available.
+
+    placeholders = ",".join("?" * len(similarity_of))
+    rows = conn.execute(f'''
+        SELECT s.sentence_hash, s.sentence_text, s.language, s.panel_id, s.panel_number, p.panel_type,
+               d.id AS document_id, d.part_number, d.document_version
+        FROM sentence_index s
+        JOIN content_panels p ON p.id = s.panel_id
+        JOIN ifu_documents d ON d.id = s.document_id
+        WHERE s.sentence_hash IN ({placeholders})
+        ORDER BY d.part_number, d.document_version, s.panel_number, s.position
+    ''', list(similarity_of)).fetchall()
+
+    usages = []
+    for row in rows:
+        usage = dict(zip(('sentence_hash', 'sentence_text', 'language', 'panel_id', 'panel_number', 'panel_type',
+                          'document_id', 'part_number', 'document_version'), row))
+        usage['exact'] = usage['sentence_hash'] == target_hash
+        usage['similarity'] = similarity_of[usage['sentence_hash']]
+        usages.append(usage)
+    return {"sentence_hash": target_hash, "normalized": normalized, "usages": usages}
+
+
+# --- 5. Execution Block ---
+if __name__ == '__main__':
+    conn = sqlite3.connect(DATABASE_FILE)
+    panel_count = rebuild_sentence_index(conn)
+    conn.close()
+    print(f"--- Sentence index rebuilt from {panel_count} panels. ---")
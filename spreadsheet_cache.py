@@ -0,0 +1,126 @@
+import os
+import glob
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# --- 1. Configuration ---
+# Parsed workbooks are cached in this folder next to the spreadsheet, one pickle per workbook.
+CACHE_FOLDER = ".spreadsheet_cache"
+# Bump when the cached format changes, so old caches are ignored rather than misread.
+CACHE_FORMAT_VERSION = 1
+
+
+# --- 2. Parsing ---
+def _convert_cell(cell):
+    """Converts an openpyxl cell the way pandas' read_excel does (blank -> '', integral floats -> int)."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _read_sheet_rows(sheet):
+    """Returns a sheet's cells as a rectangular list of rows, with trailing empty rows and cells trimmed."""
+    sheet.reset_dimensions()  # read-only sheets can carry stale dimensions
+    rows, last_row_with_data = [], -1
+    for row_number, row in enumerate(sheet.rows):
+        converted = [_convert_cell(cell) for cell in row]
+        while converted and converted[-1] == "":
+            converted.pop()
+        if converted:
+            last_row_with_data = row_number
+        rows.append(converted)
+    rows = rows[:last_row_with_data + 1]
+    if rows:
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+    return rows
+
+
+def _parse_workbook(path):
+    """Parses every sheet of a workbook in a single streaming (read-only) pass."""
+    from openpyxl import load_workbook
+    book = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        return {sheet.title: _read_sheet_rows(sheet) for sheet in book.worksheets}
+    finally:
+        book.close()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- 3. Workbook ---
+class Workbook:
+    """
+    The cells of every sheet of a workbook, parsed once. frame() derives DataFrames from
+    them with the same header / index handling (Unnamed columns, de-duplicated names, type
+    inference) as pandas.read_excel, so importers can ask for several views of one sheet
+    without re-reading the file.
+    """
+
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    @property
+    def sheet_names(self):
+        return list(self._sheets)
+
+    def frame(self, sheet_name=0, header=0, index_col=None):
+        """Equivalent to pd.read_excel(path, sheet_name=sheet_name, header=header, index_col=index_col)."""
+        if isinstance(sheet_name, int):
+            sheet_name = self.sheet_names[sheet_name]
+        if sheet_name not in self._sheets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        rows = [list(row) for row in self._sheets[sheet_name]]  # TextParser may modify its input
+        if not rows:
+            return pd.DataFrame()
+        return TextParser(rows, header=header, index_col=index_col, skip_blank_lines=False).read()
+
+
+def load_workbook(path, cache_folder=None, cache=True):
+    """
+    Returns the parsed Workbook for an .xlsx file. The parse is cached on disk keyed by the
+    file's contents, so an unchanged spreadsheet is never parsed twice. Pass cache=False
+    for one-off files (e.g. uploads) that would only leave stale cache entries behind.
+    """
+    if not cache:
+        return Workbook(_parse_workbook(path))
+    cache_folder = cache_folder or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_FOLDER)
+    sha = file_sha256(path)
+    base_name = os.path.basename(path)
+    cache_path = os.path.join(cache_folder, f"{base_name}.{sha[:16]}.v{CACHE_FORMAT_VERSION}.pkl")
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get("sha256") == sha:
+            print(f"Loaded '{base_name}' from the spreadsheet cache.")
+            return Workbook(cached["sheets"])
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, KeyError) as e:
+        print(f"WARNING: Ignoring unreadable spreadsheet cache '{cache_path}': {e}")
+
+    sheets = _parse_workbook(path)
+    os.makedirs(cache_folder, exist_ok=True)
+    # Older parses of this file are dead weight once it has changed.
+    for stale in glob.glob(os.path.join(glob.escape(cache_folder), f"{glob.escape(base_name)}.*.pkl")):
+        os.remove(stale)
+    temporary_path = cache_path + ".tmp"
+    with open(temporary_path, 'wb') as f:
+        pickle.dump({"sha256": sha, "sheets": sheets}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, cache_path)
+    return Workbook(sheets)
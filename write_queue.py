@@ -0,0 +1,137 @@
+import sqlite3
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# --- 1. Configuration ---
+# Upper bound on how many queued mutations share one transaction.
+MAX_GROUP_SIZE = 64
+# How long a request waits for its mutation to be committed before giving up.
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+class WriteQueueBusy(Exception):
+    """Raised when a mutation was still waiting in the queue at its timeout. It was cancelled and never ran."""
+
+
+class WriteQueue:
+    """
+    Single writer for the API. Every mutation goes through one thread and one connection,
+    so API requests never compete for SQLite's writer lock. Mutations that queue up while
+    a transaction is in flight are committed together in the next one ("group commit").
+
+    A mutation is a callable that takes a cursor and returns a result. It must not commit:
+    each one runs inside its own SAVEPOINT, so a failing mutation is rolled back on its own
+    without affecting the others in its group.
+
+    Bulk imports should use execute_bulk() instead, so they never sit in the queue ahead of
+    request writes.
+    """
+
+    def __init__(self, db_file, connection_factory=sqlite3.Connection):
+        self.db_file = db_file
+        self.connection_factory = connection_factory
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, mutation):
+        """Queues a mutation and returns a Future for its result."""
+        future = Future()
+        self._queue.put((mutation, future))
+        self._ensure_worker()
+        return future
+
+    def execute(self, mutation, timeout=DEFAULT_TIMEOUT_SECONDS):
+        """
+        Queues a mutation and blocks until it has been committed, returning its result. If it is
+        still queued after timeout seconds it is cancelled and WriteQueueBusy is raised; if it has
+        already started, this waits for its transaction to finish rather than report a write
+        that may yet be committed as failed.
+        """
+        future = self.submit(mutation)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteQueueBusy(f"The write was still queued after {timeout:g}s and has been cancelled.")
+            return future.result()
+
+    def execute_bulk(self, mutation):
+        """
+        Runs a bulk mutation (e.g. an import) in its own transaction on the calling thread and
+        its own connection, not through the queue. SQLite still serializes it with the queue's
+        transactions, so request writes wait for it: split big imports into several short calls.
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = mutation(conn.cursor())
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            return result
+        finally:
+            conn.close()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._worker.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,  # Transactions are managed by hand.
+                               factory=self.connection_factory)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers carry on while the writer holds a transaction open.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            group = [self._queue.get()]
+            while len(group) < MAX_GROUP_SIZE:
+                try:
+                    group.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_group(conn, group)
+
+    def _commit_group(self, conn, group):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for mutation, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT mutation')
+                try:
+                    result = mutation(conn.cursor())
+                    conn.execute('RELEASE SAVEPOINT mutation')
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO SAVEPOINT mutation')
+                    conn.execute('RELEASE SAVEPOINT mutation')
+                    outcomes.append((future, None, e))
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            # The whole group failed to commit, so nothing in it took effect.
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"ERROR committing write group of {len(group)}: {e}")
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)